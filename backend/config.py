@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from pydantic_settings import BaseSettings
 from typing import Dict, Optional
 
@@ -23,6 +24,8 @@ class Settings(BaseSettings):
     # 浏览器启动模式: "auto" 自动启动, "cdp" 连接已运行的Chrome
     BROWSER_MODE: str = "cdp"
     CDP_URL: str = "http://127.0.0.1:9222"  # CDP模式的连接地址
+    SCRAPER_MAX_CONCURRENCY: int = 3  # 同时进行的页面解析数（每个请求独占一个页面）
+    SCRAPER_BLOCK_RESOURCES: bool = True  # 解析时拦截图片/视频/字体/样式和统计请求
 
     # 网络代理配置 (可选，格式: http://host:port 或 socks5://host:port)
     BROWSER_PROXY: Optional[str] = None  # 例如: "http://127.0.0.1:7890" 或 "socks5://127.0.0.1:1080"
@@ -43,14 +46,19 @@ class Settings(BaseSettings):
     # 缓存配置
     CACHE_ENABLED: bool = True
     CACHE_TTL: int = 300  # 秒
+    STREAM_URL_CACHE_MAX: int = 1024  # 视频流URL内存缓存最大条目数
 
     # 视频文件缓存配置
     VIDEO_CACHE_ENABLED: bool = True  # 是否启用视频本地缓存
     VIDEO_CACHE_DIR: str = "cache/videos"  # 视频缓存目录
+    METADATA_DB_PATH: str = "cache/metadata.db"  # 视频元数据、已缓存视频详情和列表页的数据库路径（不放在视频缓存目录下，避免被清空缓存删除）
+    PAGES_META_PATH: str = "cache/meta.json"  # 列表总页数持久化文件（重启后分页不丢失）
     VIDEO_LIST_CACHE_TTL: int = 12 * 60 * 60  # 视频列表缓存有效期（秒），默认12小时
     CACHE_PAGE_SIZE: int = 20  # 已缓存视频列表每页数量
     AUTO_PRECACHE: bool = True  # 是否自动预缓存列表中的视频
     PRECACHE_CONCURRENT: int = 2  # 预缓存并发数
+    SEGMENT_CONCURRENCY: int = 8  # 单个视频同时下载的分片数
+    PER_HOST_CONCURRENCY: int = 6  # 缓存下载时每个源站的最大并发请求数（所有视频共享）
 
     class Config:
         env_file = ".env"
@@ -58,3 +66,24 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
+
+
+@dataclass(frozen=True, slots=True)
+class _Cfg:
+    """热路径配置快照（启动时构建一次，路由中直接读取）"""
+    TARGET_BASE_URL: str
+    VIDEO_LIST_PATH: str
+    PROXY_BASE_URL: str
+    ADMIN_PASSWORD: str
+    CACHE_TTL: int
+    STREAM_URL_CACHE_MAX: int
+    VIDEO_CACHE_ENABLED: bool
+    VIDEO_CACHE_DIR: str
+    VIDEO_LIST_CACHE_TTL: int
+    PAGES_META_PATH: str
+    CACHE_PAGE_SIZE: int
+    AUTO_PRECACHE: bool
+    PRECACHE_CONCURRENT: int
+
+
+cfg = _Cfg(**{k: getattr(settings, k) for k in _Cfg.__dataclass_fields__})
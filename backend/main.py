@@ -1,22 +1,45 @@
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 from pathlib import Path
 from pydantic import BaseModel
+from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from .config import settings
+from .responses import ORJSONResponse
 from .routers import videos, stream, cache
 from .services.scraper import scraper_service
 from .services.proxy import proxy_service
 from .services.video_cache import video_cache_service
+from .services.database import database
 
 
 class PasswordRequest(BaseModel):
     password: str
 
 
+class SPAStaticFiles(StaticFiles):
+    """静态文件服务，找不到文件时返回 index.html（支持 Vue Router 的 history 模式）"""
+
+    async def get_response(self, path: str, scope):
+        try:
+            response = await super().get_response(path, scope)
+        except StarletteHTTPException as e:
+            if e.status_code != 404:
+                raise
+            return await super().get_response("index.html", scope)
+        if response.status_code == 404:
+            return await super().get_response("index.html", scope)
+        return response
+
+
+# 本项目的日志级别跟随 DEBUG 配置，关闭时跳过热路径上的调试日志
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger(__package__).setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
+
+
 # 前端构建目录
 frontend_dist = Path(__file__).parent.parent / "frontend" / "dist"
 
@@ -28,6 +51,7 @@ async def lifespan(app: FastAPI):
     print("正在初始化Playwright...")
     await scraper_service.initialize()
     print("Playwright初始化完成")
+    await video_cache_service.warm_cache_index()
 
     yield
 
@@ -36,6 +60,7 @@ async def lifespan(app: FastAPI):
     await scraper_service.close()
     await proxy_service.close()
     await video_cache_service.close()
+    database.close()
     print("服务已关闭")
 
 
@@ -44,6 +69,7 @@ app = FastAPI(
     title="NOProxy - 视频代理服务",
     description="使用Playwright解析视频网站，提供视频列表和m3u8代理播放",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -83,16 +109,8 @@ if frontend_dist.exists():
     # 挂载静态资源目录 (js, css, images 等)
     app.mount("/assets", StaticFiles(directory=str(frontend_dist / "assets")), name="assets")
 
-    # 根路径返回 index.html
-    @app.get("/")
-    async def serve_index():
-        return FileResponse(str(frontend_dist / "index.html"))
-
-    # 其他非 API 路由返回 index.html (支持 Vue Router 的 history 模式)
-    @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
-        # 返回 index.html
-        return FileResponse(str(frontend_dist / "index.html"))
+    # 其他路径由静态文件服务处理，必须最后挂载，保证 API 路由优先匹配
+    app.mount("/", SPAStaticFiles(directory=str(frontend_dist), html=True), name="spa")
 
 
 if __name__ == "__main__":
@@ -1,14 +1,18 @@
 from fastapi import APIRouter, HTTPException, Header, Query
 from typing import Optional
+import hmac
 from ..services.video_cache import video_cache_service
-from ..config import settings
+from ..services.metadata_store import metadata_store
+from ..config import cfg
 
 router = APIRouter(prefix="/api/cache", tags=["cache"])
 
+_ADMIN_TOKEN = cfg.ADMIN_PASSWORD.encode()
+
 
 def verify_admin(admin_token: Optional[str] = None):
-    """验证管理员权限"""
-    if admin_token != settings.ADMIN_PASSWORD:
+    """验证管理员权限（常量时间比较）"""
+    if not admin_token or not hmac.compare_digest(admin_token.encode(), _ADMIN_TOKEN):
         raise HTTPException(status_code=403, detail="需要管理员权限")
 
 
@@ -19,10 +23,9 @@ async def list_cached_videos(
 ):
     """列出已缓存的视频（分页）"""
     if page_size is None:
-        page_size = settings.CACHE_PAGE_SIZE
+        page_size = cfg.CACHE_PAGE_SIZE
 
-    cached = await video_cache_service.list_cached_videos()
-    total_size = video_cache_service.get_cache_size()
+    cached, total_size = await video_cache_service.stat_all()
     total_count = len(cached)
     total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
 
@@ -32,8 +35,8 @@ async def list_cached_videos(
     paged_videos = cached[start:end]
 
     return {
-        "enabled": settings.VIDEO_CACHE_ENABLED,
-        "cache_dir": settings.VIDEO_CACHE_DIR,
+        "enabled": cfg.VIDEO_CACHE_ENABLED,
+        "cache_dir": cfg.VIDEO_CACHE_DIR,
         "total_size": total_size,
         "total_size_mb": round(total_size / (1024 * 1024), 2),
         "videos": paged_videos,
@@ -44,12 +47,27 @@ async def list_cached_videos(
     }
 
 
+@router.delete("/metadata")
+async def clear_metadata(
+    viewkey: Optional[str] = Query(None, description="只删除指定视频"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """清除持久化的视频元数据，强制重新解析（需要管理员权限）"""
+    verify_admin(x_admin_token)
+
+    count = metadata_store.delete(viewkey)
+    return {"message": f"已清除 {count} 条视频元数据"}
+
+
 @router.get("/{viewkey}")
-async def get_cache_status(viewkey: str):
+async def get_cache_status(viewkey: str, wait: float = Query(0, ge=0, le=30, description="下载中时最多等待进度更新的秒数")):
     """获取指定视频的缓存状态"""
+    if wait:
+        progress = await video_cache_service.wait_progress(viewkey, wait)
+    else:
+        progress = video_cache_service.get_download_progress(viewkey)
     is_cached = video_cache_service.is_cached(viewkey)
     is_downloading = video_cache_service.is_downloading(viewkey)
-    progress = video_cache_service.get_download_progress(viewkey)
 
     return {
         "viewkey": viewkey,
@@ -1,17 +1,88 @@
-from fastapi import APIRouter, HTTPException, Response, Request
+from fastapi import APIRouter, Header, HTTPException, Response, Request
 from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
 from base64 import urlsafe_b64decode, urlsafe_b64encode
 from ..services.proxy import proxy_service
 from ..services.scraper import scraper_service
 from ..services.video_cache import video_cache_service
-from ..config import settings
+from ..services.metadata_store import metadata_store
+from ..config import cfg
+from .cache import verify_admin
+from cachetools import LRUCache, TTLCache
+from functools import partial
+from hashlib import blake2b
+from typing import Optional
 import aiohttp
 import asyncio
+import logging
+import os
+import re
+import socket
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/stream", tags=["stream"])
 
-# 缓存视频 URL
-_video_cache = {}
+# 视频页地址前缀（拼接 viewkey 即为视频页）
+_VIEW_URL_PREFIX = f"{cfg.TARGET_BASE_URL}/view_video.php?viewkey="
+
+# 缓存视频 URL（有界 LRU + TTL，避免内存无限增长和返回过期的签名链接）
+_video_cache = TTLCache(maxsize=cfg.STREAM_URL_CACHE_MAX, ttl=cfg.CACHE_TTL)
+_video_cache_lock = asyncio.Lock()
+
+# 正在解析的视频: video_id -> 解析任务（合并并发请求）
+_inflight: dict[str, asyncio.Task] = {}
+_inflight_lock = asyncio.Lock()
+
+# 静态响应头（模块级常量，避免每个请求重复构建字典）
+_M3U8_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Cache-Control": "no-cache",
+}
+_SEGMENT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Cache-Control": "max-age=3600",
+}
+_CACHED_SEGMENT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Cache-Control": "public, max-age=86400, immutable",
+}
+_IMAGE_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Cache-Control": "public, max-age=86400",
+}
+_CACHED_MP4_HEADERS = {
+    "Accept-Ranges": "bytes",
+    "Access-Control-Allow-Origin": "*",
+}
+_MP4_BASE_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Accept-Ranges": "bytes",
+    "Cache-Control": "public, max-age=3600",  # 允许浏览器缓存
+}
+
+# 缓存m3u8中的每一行（去掉首尾空白，与逐行 strip() 一致）
+_LINE_RE = re.compile(rb"^[ \t\r\x0b\x0c]*(.*?)[ \t\r\x0b\x0c]*$", re.M)
+
+# 缓存分片接口的路径参数（视频ID只含字母数字，分片名为下载时生成的 N.ts）
+_VIEWKEY_RE = re.compile(r"[A-Za-z0-9]+")
+_CACHED_SEGMENT_NAME_RE = re.compile(r"\d+\.ts")
+
+# 根据URL判断视频格式（忽略大小写，兼容查询参数）
+_MP4_RE = re.compile(r"\.mp4(\?|$)", re.I)
+_M3U8_RE = re.compile(r"\.m3u8(\?|$)", re.I)
+
+# 重写后的缓存m3u8: (viewkey, proxy_base) -> (原文件摘要, 重写结果)
+_rewritten_m3u8_cache = LRUCache(maxsize=512)
+
+# 单区间 Range 头: bytes=start-end / bytes=start- / bytes=-suffix
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+# 缓存MP4区间读取的块大小
+_MP4_RANGE_CHUNK_SIZE = 2 * 1024 * 1024
+
+# 热门封面图内存缓存: video_id -> (图片内容, Content-Type)
+_thumb_cache = LRUCache(maxsize=256)
 
 # 全局连接池（复用连接）
 _connector = None
@@ -25,8 +96,11 @@ async def get_session():
         # 创建优化的连接器
         _connector = aiohttp.TCPConnector(
             limit=100,  # 最大连接数
-            limit_per_host=10,  # 每个主机最大连接数
+            limit_per_host=20,  # 每个主机最大连接数（播放器会并发请求多个分片）
             ttl_dns_cache=300,  # DNS缓存时间
+            resolver=aiohttp.AsyncResolver(),  # 使用 aiodns 在事件循环内解析，无需线程切换
+            family=socket.AF_INET,  # 只用 IPv4，避免无 AAAA 记录时的额外解析
+            keepalive_timeout=90,  # 长连接保持，减少分片请求间的 TLS 握手
             enable_cleanup_closed=True,
         )
         _session = aiohttp.ClientSession(
@@ -40,149 +114,243 @@ async def get_session():
     return _session
 
 
+async def _resolve_video(video_id: str):
+    """解析视频页获取视频URL，并写入URL缓存"""
+    # 构建视频页URL
+    page_url = _VIEW_URL_PREFIX + video_id
+    logger.debug("获取视频详情: %s", page_url)
+    detail = await scraper_service.get_video_detail(page_url)
+
+    if detail and detail.m3u8_url:
+        async with _video_cache_lock:
+            _video_cache[video_id] = {"url": detail.m3u8_url, "detail": detail}
+        metadata_store.put(video_id, detail.m3u8_url, detail, cfg.CACHE_TTL)
+        logger.debug("获取到视频URL: %s", detail.m3u8_url)
+
+    return detail
+
+
+def _on_resolve_done(video_id: str, task: asyncio.Task):
+    """解析结束后移出进行中列表"""
+    _inflight.pop(video_id, None)
+    # 取出异常，避免所有等待方都已断开时出现 "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+async def _resolve_video_once(video_id: str):
+    """合并同一视频的并发解析请求，只有第一个请求真正打开浏览器解析"""
+    async with _inflight_lock:
+        task = _inflight.get(video_id)
+        if task is None:
+            task = asyncio.create_task(_resolve_video(video_id))
+            task.add_done_callback(partial(_on_resolve_done, video_id))
+            _inflight[video_id] = task
+
+    # shield: 单个客户端断开不会取消其他请求共享的解析任务
+    return await asyncio.shield(task)
+
+
 @router.get("/{video_id}")
 async def get_stream(video_id: str, request: Request):
     """获取视频流代理"""
-    print(f"=== 收到流请求: video_id={video_id} ===")
+    logger.debug("=== 收到流请求: video_id=%s ===", video_id)
 
     # 检查本地缓存
-    if settings.VIDEO_CACHE_ENABLED and video_cache_service.is_cached(video_id):
-        print(f"[Cache] 使用本地缓存: {video_id}")
+    if cfg.VIDEO_CACHE_ENABLED and video_cache_service.is_cached(video_id):
+        logger.debug("[Cache] 使用本地缓存: %s", video_id)
 
         # 检查是MP4还是M3U8缓存
-        mp4_path = video_cache_service.get_cached_mp4_path(video_id)
-        if mp4_path:
-            print(f"[Cache] 返回缓存的MP4: {mp4_path}")
-            return await serve_cached_mp4(mp4_path, request)
+        cached_mp4 = await video_cache_service.open_mp4_sendfile(video_id)
+        if cached_mp4:
+            mp4_path, mp4_stat = cached_mp4
+            logger.debug("[Cache] 返回缓存的MP4: %s", mp4_path)
+            return serve_cached_mp4(mp4_path, mp4_stat, request)
 
         # 返回缓存的M3U8
         m3u8_content = await video_cache_service.get_cached_m3u8(video_id)
         if m3u8_content:
             # 重写m3u8中的分片路径为代理URL
-            proxy_base = settings.PROXY_BASE_URL
-            rewritten_m3u8 = _rewrite_cached_m3u8(m3u8_content, video_id, proxy_base)
+            proxy_base = cfg.PROXY_BASE_URL
+            rewritten_m3u8 = _get_rewritten_m3u8(m3u8_content, video_id, proxy_base)
             return Response(
                 content=rewritten_m3u8,
                 media_type="application/vnd.apple.mpegurl",
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Cache-Control": "no-cache",
-                }
+                headers=_M3U8_HEADERS
             )
 
-    cache_key = f"video_{video_id}"
     detail = None
 
     # 检查URL缓存（同时缓存了detail）
-    if cache_key in _video_cache:
-        cached = _video_cache[cache_key]
+    async with _video_cache_lock:
+        cached = _video_cache.get(video_id)
+
+    if not cached:
+        # 内存未命中，查询持久化的元数据（重启后避免重新解析）
+        stored = metadata_store.get(video_id)
+        if stored:
+            cached = {"url": stored[0], "detail": stored[1]}
+            async with _video_cache_lock:
+                _video_cache[video_id] = cached
+
+    if cached:
         video_url = cached["url"]
         detail = cached.get("detail")
-        print(f"使用缓存的URL: {video_url}")
+        logger.debug("使用缓存的URL: %s", video_url)
     else:
-        # 构建视频页URL
-        page_url = f"{settings.TARGET_BASE_URL}/view_video.php?viewkey={video_id}"
-        print(f"获取视频详情: {page_url}")
-        detail = await scraper_service.get_video_detail(page_url)
+        # 同一视频的并发请求只解析一次
+        detail = await _resolve_video_once(video_id)
 
         if not detail or not detail.m3u8_url:
-            print("错误: 无法获取视频流URL")
+            logger.warning("错误: 无法获取视频流URL")
             raise HTTPException(status_code=404, detail="无法获取视频流")
 
         video_url = detail.m3u8_url
-        _video_cache[cache_key] = {"url": video_url, "detail": detail}
-        print(f"获取到视频URL: {video_url}")
 
     # 判断是 MP4 还是 M3U8
-    is_mp4 = ".mp4" in video_url.lower() or not ".m3u8" in video_url.lower()
+    if _MP4_RE.search(video_url):
+        is_mp4 = True
+    elif _M3U8_RE.search(video_url):
+        is_mp4 = False
+    else:
+        # URL无法判断格式，检测内容开头
+        is_mp4 = not await _sniff_is_m3u8(video_url)
 
     if is_mp4:
-        print("检测到MP4格式，使用流式代理")
+        logger.debug("检测到MP4格式，使用流式代理")
         # 启动后台缓存下载
-        if settings.VIDEO_CACHE_ENABLED and detail:
+        if cfg.VIDEO_CACHE_ENABLED and detail:
             await video_cache_service.start_mp4_cache_download(video_id, video_url, detail)
         return await proxy_mp4_stream(video_url, request)
     else:
-        print("检测到M3U8格式，重写并代理")
+        logger.debug("检测到M3U8格式，重写并代理")
         try:
-            proxy_base = settings.PROXY_BASE_URL
-            m3u8_content = await proxy_service.fetch_m3u8(video_url, proxy_base)
+            proxy_base = cfg.PROXY_BASE_URL
+            m3u8_content, original_m3u8 = await proxy_service.fetch_m3u8(video_url, proxy_base)
 
             # 启动后台缓存下载（传入原始m3u8内容用于下载）
-            if settings.VIDEO_CACHE_ENABLED and detail:
-                # 获取原始m3u8内容（未重写的）
-                session = await proxy_service.get_session()
-                async with session.get(video_url) as resp:
-                    original_m3u8 = await resp.text()
+            if cfg.VIDEO_CACHE_ENABLED and detail:
                 await video_cache_service.start_cache_download(video_id, video_url, original_m3u8, detail)
 
             return Response(
                 content=m3u8_content,
                 media_type="application/vnd.apple.mpegurl",
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Cache-Control": "no-cache",
-                }
+                headers=_M3U8_HEADERS
             )
         except Exception as e:
-            print(f"M3U8处理失败: {e}，尝试作为MP4代理")
+            logger.warning("M3U8处理失败: %s，尝试作为MP4代理", e)
             return await proxy_mp4_stream(video_url, request)
 
 
-def _rewrite_cached_m3u8(content: str, viewkey: str, proxy_base: str) -> str:
+async def _sniff_is_m3u8(url: str) -> bool:
+    """读取开头几个字节检测是否为m3u8"""
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+        "Referer": cfg.TARGET_BASE_URL,
+        "Range": "bytes=0-15",
+    }
+    try:
+        session = await get_session()
+        async with session.get(url, headers=headers) as resp:
+            head = await resp.content.read(16)
+        return head.lstrip().startswith(b"#EXTM3U")
+    except Exception as e:
+        logger.warning("检测视频格式失败: %s", e)
+        return False
+
+
+def _rewrite_cached_m3u8(content: bytes, viewkey: str, proxy_base: str) -> bytes:
     """重写缓存的m3u8文件，将本地分片路径改为代理URL"""
-    lines = content.split("\n")
-    new_lines = []
+    # 非注释行是分片文件名（如 0.ts, 1.ts）
+    # 转换为代理URL: /api/stream/cached-segment/{viewkey}/{segment_name}
+    prefix = f"{proxy_base}/api/stream/cached-segment/{viewkey}/".encode()
 
-    for line in lines:
-        line = line.strip()
-        if not line:
-            new_lines.append(line)
-            continue
+    def rewrite_line(match: re.Match) -> bytes:
+        line = match.group(1)
+        if not line or line.startswith(b"#"):
+            return line
+        return prefix + line
 
-        if line.startswith("#"):
-            new_lines.append(line)
-            continue
+    return _LINE_RE.sub(rewrite_line, content)
 
-        # 非注释行是分片文件名（如 0.ts, 1.ts）
-        # 转换为代理URL: /api/stream/cached-segment/{viewkey}/{segment_name}
-        proxy_url = f"{proxy_base}/api/stream/cached-segment/{viewkey}/{line}"
-        new_lines.append(proxy_url)
 
-    return "\n".join(new_lines)
+def _get_rewritten_m3u8(content: bytes, viewkey: str, proxy_base: str) -> bytes:
+    """获取重写后的缓存m3u8，原文件未变化时直接复用上次的结果"""
+    digest = blake2b(content, digest_size=8).digest()
+    key = (viewkey, proxy_base)
+    cached = _rewritten_m3u8_cache.get(key)
+    if cached and cached[0] == digest:
+        return cached[1]
 
+    rewritten = _rewrite_cached_m3u8(content, viewkey, proxy_base)
+    _rewritten_m3u8_cache[key] = (digest, rewritten)
+    return rewritten
 
-async def serve_cached_mp4(mp4_path, request: Request):
-    """服务缓存的MP4文件，支持Range请求"""
-    import os
-    import aiofiles
 
-    file_size = os.path.getsize(mp4_path)
+async def _iter_file_range(path, start: int, length: int):
+    """按区间读取文件（os.pread 在线程中执行，每块只需一次线程切换）"""
+    fd = await asyncio.to_thread(os.open, path, os.O_RDONLY)
+    try:
+        offset = start
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(os.pread, fd, min(_MP4_RANGE_CHUNK_SIZE, remaining), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        os.close(fd)
+
+
+def _range_not_satisfiable(file_size: int) -> Response:
+    """返回 416 Range Not Satisfiable"""
+    return Response(
+        status_code=416,
+        headers={
+            "Content-Range": f"bytes */{file_size}",
+            "Access-Control-Allow-Origin": "*",
+        }
+    )
+
+
+class _FullFileResponse(FileResponse):
+    """始终发送完整文件的 FileResponse（新版 Starlette 会自行解析 Range 头，格式错误时返回 400）"""
+
+    async def __call__(self, scope, receive, send):
+        # 去掉请求中的 Range 头，区间请求已由 serve_cached_mp4 处理
+        scope = {**scope, "headers": [(k, v) for k, v in scope["headers"] if k != b"range"]}
+        await super().__call__(scope, receive, send)
+
+
+def serve_cached_mp4(mp4_path, mp4_stat: os.stat_result, request: Request):
+    """服务缓存的MP4文件，支持Range请求"""
+    file_size = mp4_stat.st_size
     range_header = request.headers.get("range")
 
-    if range_header:
-        # 解析Range头
-        range_match = range_header.replace("bytes=", "").split("-")
-        start = int(range_match[0]) if range_match[0] else 0
-        end = int(range_match[1]) if range_match[1] else file_size - 1
+    # 不支持多区间请求
+    if range_header and "," in range_header:
+        return _range_not_satisfiable(file_size)
 
-        content_length = end - start + 1
+    range_match = _RANGE_RE.fullmatch(range_header.strip()) if range_header else None
+    if range_match and (range_match.group(1) or range_match.group(2)):
+        first, last = range_match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), file_size - 1) if last else file_size - 1
+        else:
+            # 后缀区间 bytes=-N 表示最后N个字节
+            start = max(file_size - int(last), 0)
+            end = file_size - 1
 
-        async def stream_file():
-            async with aiofiles.open(mp4_path, "rb") as f:
-                await f.seek(start)
-                remaining = content_length
-                chunk_size = 512 * 1024
-                while remaining > 0:
-                    read_size = min(chunk_size, remaining)
-                    chunk = await f.read(read_size)
-                    if not chunk:
-                        break
-                    remaining -= len(chunk)
-                    yield chunk
+        if start > end:
+            return _range_not_satisfiable(file_size)
+
+        content_length = end - start + 1
 
         return StreamingResponse(
-            stream_file(),
+            _iter_file_range(mp4_path, start, content_length),
             status_code=206,
             headers={
                 "Content-Type": "video/mp4",
@@ -193,24 +361,28 @@ async def serve_cached_mp4(mp4_path, request: Request):
             }
         )
     else:
-        # 完整文件请求
-        return FileResponse(
+        # 完整文件请求（无Range头或无法解析）
+        # 传入已有的文件信息，FileResponse 不再重复 stat；服务器支持时直接 sendfile 发送
+        return _FullFileResponse(
             mp4_path,
             media_type="video/mp4",
-            headers={
-                "Accept-Ranges": "bytes",
-                "Access-Control-Allow-Origin": "*",
-            }
+            headers=_CACHED_MP4_HEADERS,
+            stat_result=mp4_stat
         )
 
 
+async def _release_response(resp: aiohttp.ClientResponse):
+    """释放上游响应连接（在事件循环中执行）"""
+    resp.release()
+
+
 async def proxy_mp4_stream(url: str, request: Request):
     """代理MP4视频流，支持Range请求"""
-    print(f"=== 代理MP4流: {url} ===")
+    logger.debug("=== 代理MP4流: %s ===", url)
 
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Referer": settings.TARGET_BASE_URL,
+        "Referer": cfg.TARGET_BASE_URL,
         "Accept": "*/*",
         "Accept-Encoding": "identity",  # 不压缩，直接传输
     }
@@ -219,7 +391,7 @@ async def proxy_mp4_stream(url: str, request: Request):
     range_header = request.headers.get("range")
     if range_header:
         headers["Range"] = range_header
-        print(f"Range请求: {range_header}")
+        logger.debug("Range请求: %s", range_header)
 
     session = await get_session()
 
@@ -231,24 +403,9 @@ async def proxy_mp4_stream(url: str, request: Request):
         content_range = resp.headers.get("Content-Range", "")
         status_code = resp.status
 
-        print(f"上游响应: status={status_code}, content-type={content_type}, length={content_length}")
-
-        # 使用更大的缓冲区 (512KB) 提高传输效率
-        CHUNK_SIZE = 512 * 1024
+        logger.debug("上游响应: status=%s, content-type=%s, length=%s", status_code, content_type, content_length)
 
-        async def stream_response():
-            try:
-                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
-                    yield chunk
-            finally:
-                resp.release()
-
-        response_headers = {
-            "Access-Control-Allow-Origin": "*",
-            "Accept-Ranges": "bytes",
-            "Content-Type": content_type,
-            "Cache-Control": "public, max-age=3600",  # 允许浏览器缓存
-        }
+        response_headers = {**_MP4_BASE_HEADERS, "Content-Type": content_type}
 
         if content_length:
             response_headers["Content-Length"] = content_length
@@ -257,47 +414,48 @@ async def proxy_mp4_stream(url: str, request: Request):
         if content_range:
             response_headers["Content-Range"] = content_range
 
+        # 直接转发上游收到的数据块，响应结束后释放连接
         return StreamingResponse(
-            stream_response(),
+            resp.content.iter_any(),
             status_code=status_code,  # 使用上游的状态码 (200 或 206)
-            headers=response_headers
+            headers=response_headers,
+            background=BackgroundTask(_release_response, resp),
         )
     except Exception as e:
-        print(f"MP4代理失败: {e}")
+        logger.warning("MP4代理失败: %s", e)
         raise HTTPException(status_code=500, detail=f"MP4代理失败: {str(e)}")
 
 
 @router.get("/segment/{encoded_url:path}")
 async def get_segment(encoded_url: str):
     """代理获取ts分片或其他资源"""
+    # 编码时总会补齐 padding，长度不是4的倍数一定是非法输入
+    if len(encoded_url) & 3:
+        raise HTTPException(status_code=400, detail="无效的资源地址")
+
     try:
-        # 解码原始URL
-        original_url = urlsafe_b64decode(encoded_url.encode()).decode()
+        # 解码原始URL（ASCII 字符串可直接解码，无需先 encode）
+        original_url = urlsafe_b64decode(encoded_url).decode()
 
         # 判断是m3u8还是其他资源
         if ".m3u8" in original_url:
             # 如果是子m3u8，也需要重写
-            proxy_base = settings.PROXY_BASE_URL
-            content = await proxy_service.fetch_m3u8(original_url, proxy_base)
+            proxy_base = cfg.PROXY_BASE_URL
+            content, _ = await proxy_service.fetch_m3u8(original_url, proxy_base)
             return Response(
                 content=content,
                 media_type="application/vnd.apple.mpegurl",
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Cache-Control": "no-cache",
-                }
+                headers=_M3U8_HEADERS
             )
         else:
-            # 获取分片
-            content, content_type = await proxy_service.fetch_segment(original_url)
+            # 流式转发分片，不在内存中缓冲整个分片
+            stream = proxy_service.fetch_segment_stream(original_url)
+            content_type = await anext(stream)
 
-            return Response(
-                content=content,
+            return StreamingResponse(
+                stream,
                 media_type=content_type,
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Cache-Control": "max-age=3600",
-                }
+                headers=_SEGMENT_HEADERS
             )
 
     except Exception as e:
@@ -305,8 +463,23 @@ async def get_segment(encoded_url: str):
 
 
 @router.get("/cached-segment/{viewkey}/{segment_name}")
-async def get_cached_segment(viewkey: str, segment_name: str):
-    """获取本地缓存的分片"""
+async def get_cached_segment(viewkey: str, segment_name: str, request: Request):
+    """获取本地缓存的分片（支持 If-None-Match 条件请求）"""
+    # 只接受下载时生成的分片名，拒绝访问缓存目录中的其他文件
+    if not _VIEWKEY_RE.fullmatch(viewkey) or not _CACHED_SEGMENT_NAME_RE.fullmatch(segment_name):
+        raise HTTPException(status_code=404, detail="缓存分片不存在")
+
+    etag = await video_cache_service.get_segment_etag(viewkey, segment_name)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="缓存分片不存在")
+
+    headers = {**_CACHED_SEGMENT_HEADERS, "ETag": etag}
+
+    # 分片内容不会变化，ETag 匹配时直接返回 304
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers)
+
     content = await video_cache_service.get_cached_segment(viewkey, segment_name)
 
     if content is None:
@@ -315,10 +488,7 @@ async def get_cached_segment(viewkey: str, segment_name: str):
     return Response(
         content=content,
         media_type="video/MP2T",
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Cache-Control": "max-age=86400",
-        }
+        headers=headers
     )
 
 
@@ -326,16 +496,13 @@ async def get_cached_segment(viewkey: str, segment_name: str):
 async def get_direct_stream(url: str):
     """直接获取m3u8内容（通过URL参数）"""
     try:
-        proxy_base = settings.PROXY_BASE_URL
-        m3u8_content = await proxy_service.fetch_m3u8(url, proxy_base)
+        proxy_base = cfg.PROXY_BASE_URL
+        m3u8_content, _ = await proxy_service.fetch_m3u8(url, proxy_base)
 
         return Response(
             content=m3u8_content,
             media_type="application/vnd.apple.mpegurl",
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Cache-Control": "no-cache",
-            }
+            headers=_M3U8_HEADERS
         )
 
     except Exception as e:
@@ -343,27 +510,36 @@ async def get_direct_stream(url: str):
 
 
 @router.delete("/cache")
-async def clear_stream_cache():
-    """清除URL缓存"""
-    _video_cache.clear()
+async def clear_stream_cache(viewkey: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    """清除URL缓存和持久化的元数据，指定 viewkey 时只清除该视频（需要管理员权限）"""
+    verify_admin(x_admin_token)
+
+    async with _video_cache_lock:
+        if viewkey:
+            _video_cache.pop(viewkey, None)
+        else:
+            _video_cache.clear()
+    metadata_store.delete(viewkey)
+    if viewkey:
+        return {"message": f"已清除视频流缓存: {viewkey}"}
     return {"message": "流缓存已清除"}
 
 
 @router.get("/image/{video_id}")
 async def get_image(video_id: str, url: str = None):
     """获取视频封面图代理"""
-    # 优先使用本地缓存
-    if settings.VIDEO_CACHE_ENABLED:
+    # 优先使用内存缓存
+    cached = _thumb_cache.get(video_id)
+    if cached:
+        return Response(content=cached[0], media_type=cached[1], headers=_IMAGE_HEADERS)
+
+    # 其次使用本地缓存
+    if cfg.VIDEO_CACHE_ENABLED:
         thumb_path = video_cache_service.get_cached_thumbnail_path(video_id)
         if thumb_path:
-            return FileResponse(
-                thumb_path,
-                media_type="image/jpeg",
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Cache-Control": "public, max-age=86400",
-                }
-            )
+            content = await asyncio.to_thread(thumb_path.read_bytes)
+            _thumb_cache[video_id] = (content, "image/jpeg")
+            return Response(content=content, media_type="image/jpeg", headers=_IMAGE_HEADERS)
 
     # 没有缓存且没有提供URL，返回404
     if not url:
@@ -374,7 +550,7 @@ async def get_image(video_id: str, url: str = None):
         session = await get_session()
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Referer": settings.TARGET_BASE_URL,
+            "Referer": cfg.TARGET_BASE_URL,
         }
 
         async with session.get(url, headers=headers) as resp:
@@ -383,18 +559,16 @@ async def get_image(video_id: str, url: str = None):
 
             content = await resp.read()
             content_type = resp.headers.get("Content-Type", "image/jpeg")
+            _thumb_cache[video_id] = (content, content_type)
 
             # 后台缓存图片
-            if settings.VIDEO_CACHE_ENABLED:
+            if cfg.VIDEO_CACHE_ENABLED:
                 asyncio.create_task(video_cache_service.download_thumbnail(video_id, url))
 
             return Response(
                 content=content,
                 media_type=content_type,
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Cache-Control": "public, max-age=86400",
-                }
+                headers=_IMAGE_HEADERS
             )
     except HTTPException:
         raise
@@ -1,50 +1,147 @@
 from fastapi import APIRouter, HTTPException, Query
+from ..responses import ORJSONResponse
 from ..models.video import VideoListResponse, VideoDetail, VideoItem
 from ..services.scraper import scraper_service
 from ..services.video_cache import video_cache_service
 from ..services.proxy import proxy_service
-from ..config import settings
+from ..config import cfg
+from cachetools import TTLCache
+from pydantic import TypeAdapter
+from functools import partial
+from pathlib import Path
 import asyncio
+import logging
+import orjson
+import os
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/videos", tags=["videos"])
 
-_total_pages_cache = {"total_pages": 1}
+# 视频页地址前缀（拼接 viewkey 即为视频页）
+_VIEW_URL_PREFIX = f"{cfg.TARGET_BASE_URL}/view_video.php?viewkey="
+
+# 总页数按列表来源分别持久化，重启后分页不会退回1页
+_PAGES_SOURCE = cfg.TARGET_BASE_URL + cfg.VIDEO_LIST_PATH
+_META_FLUSH_DELAY = 5  # 总页数变化后延迟写盘（秒），合并短时间内的多次更新
+
+
+def _load_meta() -> dict:
+    """读取持久化的元信息"""
+    try:
+        with open(cfg.PAGES_META_PATH, "rb") as f:
+            meta = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+    if not isinstance(meta, dict) or not isinstance(meta.get("total_pages"), dict):
+        return {}
+    return meta
+
+
+_meta = _load_meta()
+_total_pages_cache = {"total_pages": _meta.get("total_pages", {}).get(_PAGES_SOURCE, 1)}
+_meta_flush_task = None
+
+# 列表/详情内存缓存（有界，过期自动淘汰），键为 list_{page} / detail_{video_id}
+# 列表缓存保存已校验的原始数据，命中时直接序列化返回
+# 详情中的视频地址会过期，有效期与视频流URL缓存一致
+_list_cache = TTLCache(maxsize=512, ttl=cfg.VIDEO_LIST_CACHE_TTL)
+_detail_cache = TTLCache(maxsize=512, ttl=cfg.CACHE_TTL)
+_cache_lock = asyncio.Lock()
+
+# 进行中的上游抓取: 缓存键 -> 抓取任务（合并同一键的并发请求）
+_inflight: dict[str, asyncio.Task] = {}
+_inflight_lock = asyncio.Lock()
+
+# 批量校验缓存中的视频列表（比逐个 VideoItem(**v) 快）
+_video_items_adapter = TypeAdapter(list[VideoItem])
+
+_THUMBNAIL_CONCURRENT = 8  # 封面图下载并发数
 _precache_queue = set()  # 正在预缓存的视频ID
+_PRECACHE_QUEUE_MAX = 256  # 同时预缓存的视频数上限
+
+
+def _write_meta_sync(data: bytes):
+    """原子写入元信息文件（同步，需在线程中调用）"""
+    path = Path(cfg.PAGES_META_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+async def _flush_meta():
+    """延迟写入总页数"""
+    global _meta_flush_task
+    await asyncio.sleep(_META_FLUSH_DELAY)
+    _meta_flush_task = None
+
+    _meta.setdefault("total_pages", {})[_PAGES_SOURCE] = _total_pages_cache["total_pages"]
+    try:
+        await asyncio.to_thread(_write_meta_sync, orjson.dumps(_meta))
+    except OSError as e:
+        logger.warning("保存总页数失败: %s", e)
+
+
+def _set_total_pages(total_pages: int):
+    """更新总页数，变化时安排后台写盘"""
+    global _meta_flush_task
+    if total_pages == _total_pages_cache["total_pages"]:
+        return
+    _total_pages_cache["total_pages"] = total_pages
+    if _meta_flush_task is None:
+        _meta_flush_task = asyncio.create_task(_flush_meta())
 
 
 async def _download_thumbnails(videos):
     """后台下载视频封面图"""
-    for video in videos:
-        if video.thumbnail:
+    semaphore = asyncio.Semaphore(_THUMBNAIL_CONCURRENT)
+
+    async def download_with_limit(video):
+        async with semaphore:
             await video_cache_service.download_thumbnail(video.id, video.thumbnail)
 
+    # 并发下载（download_thumbnail 自行捕获异常，共用缓存服务的会话连接）
+    async with asyncio.TaskGroup() as tg:
+        for v in videos:
+            if v.thumbnail:
+                tg.create_task(download_with_limit(v))
+
 
 async def _precache_video(video_id: str):
     """预缓存单个视频"""
-    # 检查是否已缓存或正在下载
-    if video_cache_service.is_cached(video_id):
+    # 检查是否正在预缓存/下载或已缓存（先做内存查找，最后才访问磁盘）
+    if video_id in _precache_queue or video_cache_service.is_downloading(video_id):
         return
-    if video_cache_service.is_downloading(video_id):
+    if video_cache_service.is_cached(video_id):
         return
-    if video_id in _precache_queue:
+    # 预缓存任务过多时直接跳过，避免持续涌入的列表请求无限堆积
+    if len(_precache_queue) >= _PRECACHE_QUEUE_MAX:
+        logger.debug("[预缓存] 队列已满，跳过 %s", video_id)
         return
 
     _precache_queue.add(video_id)
     try:
-        video_url = f"{settings.TARGET_BASE_URL}/view_video.php?viewkey={video_id}"
-        detail = await scraper_service.get_video_detail_in_new_tab(video_url)
+        # 与详情接口共用缓存和进行中的抓取，不重复打开刚抓取过的页面
+        cache_key = f"detail_{video_id}"
+        async with _cache_lock:
+            detail = _detail_cache.get(cache_key)
+        if detail is None:
+            logger.debug("[预缓存] 获取视频详情: %s", video_id)
+            detail = await _fetch_once(cache_key, partial(_scrape_video_detail, video_id))
 
         if not detail or not detail.m3u8_url:
-            print(f"[预缓存] 跳过 {video_id}: 无法获取视频链接")
+            logger.debug("[预缓存] 跳过 %s: 无法获取视频链接", video_id)
             return
 
         # 再次检查（可能在获取详情期间用户已开始播放）
-        if video_cache_service.is_cached(video_id) or video_cache_service.is_downloading(video_id):
+        if video_cache_service.is_downloading(video_id) or video_cache_service.is_cached(video_id):
             return
 
         # 启动缓存下载
         video_src = detail.m3u8_url
-        is_mp4 = ".mp4" in video_src.lower() or ".m3u8" not in video_src.lower()
+        video_src_lower = video_src.lower()
+        is_mp4 = ".mp4" in video_src_lower or ".m3u8" not in video_src_lower
 
         if is_mp4:
             await video_cache_service.start_mp4_cache_download(video_id, video_src, detail)
@@ -55,10 +152,10 @@ async def _precache_video(video_id: str):
                 original_m3u8 = await resp.text()
             await video_cache_service.start_cache_download(video_id, video_src, original_m3u8, detail)
 
-        print(f"[预缓存] 已启动: {video_id}")
+        logger.debug("[预缓存] 已启动: %s", video_id)
 
     except Exception as e:
-        print(f"[预缓存] 失败 {video_id}: {e}")
+        logger.warning("[预缓存] 失败 %s: %s", video_id, e)
     finally:
         _precache_queue.discard(video_id)
 
@@ -66,78 +163,116 @@ async def _precache_video(video_id: str):
 async def _precache_videos(videos):
     """后台预缓存视频列表"""
     # 使用信号量限制并发数
-    semaphore = asyncio.Semaphore(settings.PRECACHE_CONCURRENT)
+    semaphore = asyncio.Semaphore(cfg.PRECACHE_CONCURRENT)
 
     async def precache_with_limit(video):
         async with semaphore:
             await _precache_video(video.id)
 
-    # 并发预缓存
-    tasks = [precache_with_limit(v) for v in videos]
-    await asyncio.gather(*tasks, return_exceptions=True)
+    # 并发预缓存（_precache_video 自行捕获异常，单个失败不会取消其他任务）
+    async with asyncio.TaskGroup() as tg:
+        for v in videos:
+            tg.create_task(precache_with_limit(v))
+
+
+def _on_fetch_done(key: str, task: asyncio.Task):
+    """抓取结束后移出进行中列表"""
+    _inflight.pop(key, None)
+    # 取出异常，避免所有等待方都已断开时出现 "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+async def _fetch_once(key: str, fetch):
+    """合并同一缓存键的并发抓取，只有第一个请求真正访问上游"""
+    async with _inflight_lock:
+        task = _inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fetch())
+            task.add_done_callback(partial(_on_fetch_done, key))
+            _inflight[key] = task
+    # shield: 单个客户端断开不会取消其他等待方共享的抓取
+    return await asyncio.shield(task)
+
+
+async def _scrape_video_list(page: int):
+    """从网站抓取视频列表并写入缓存，无数据返回 None"""
+    result = await scraper_service.get_video_list(page_num=page)
+    if not result or not result.videos:
+        return None
+
+    # 更新总页数缓存
+    if result.total_pages > 1:
+        _set_total_pages(result.total_pages)
+
+    # 列表数据只在写入时校验一次，之后缓存命中直接返回原始数据
+    payload = {
+        "videos": [v.model_dump() for v in result.videos],
+        "total": len(result.videos),
+        "page": page,
+        "total_pages": _total_pages_cache["total_pages"]
+    }
+    async with _cache_lock:
+        _list_cache[f"list_{page}"] = payload
+
+    # 保存到文件缓存
+    if cfg.VIDEO_CACHE_ENABLED:
+        await video_cache_service.save_list_cache(page, payload)
+        # 后台异步下载封面图
+        asyncio.create_task(_download_thumbnails(result.videos))
+        # 后台异步预缓存视频
+        if cfg.AUTO_PRECACHE:
+            asyncio.create_task(_precache_videos(result.videos))
+
+    return payload
+
+
+async def _scrape_video_detail(video_id: str):
+    """从网站抓取视频详情并写入缓存"""
+    video_url = _VIEW_URL_PREFIX + video_id
+    detail = await scraper_service.get_video_detail(video_url)
+    if detail:
+        async with _cache_lock:
+            _detail_cache[f"detail_{video_id}"] = detail
+    return detail
 
 
 @router.get("", response_model=VideoListResponse)
 async def get_video_list(page: int = Query(1, ge=1, description="页码")):
     """获取视频列表"""
-    # 优先使用有效期内的缓存
-    if settings.VIDEO_CACHE_ENABLED:
-        fresh_cache = await video_cache_service.get_cached_list(page, max_age=settings.VIDEO_LIST_CACHE_TTL)
+    cache_key = f"list_{page}"
+    async with _cache_lock:
+        cached = _list_cache.get(cache_key)
+    if cached:
+        return ORJSONResponse(content=cached)
+
+    # 优先使用有效期内的缓存（写入前已校验，直接返回原始数据）
+    # 不放入内存缓存：文件缓存可能已接近过期，重新计时会让列表过期时间翻倍（缓存服务自身已有内存缓存）
+    if cfg.VIDEO_CACHE_ENABLED:
+        fresh_cache = await video_cache_service.get_cached_list(page, max_age=cfg.VIDEO_LIST_CACHE_TTL)
         if fresh_cache:
-            videos = [VideoItem(**v) for v in fresh_cache.get("videos", [])]
-            response = VideoListResponse(
-                videos=videos,
-                total=fresh_cache.get("total", len(videos)),
-                page=fresh_cache.get("page", page),
-                total_pages=fresh_cache.get("total_pages", 1)
-            )
-            if response.total_pages > 1:
-                _total_pages_cache["total_pages"] = response.total_pages
-            return response
+            total_pages = fresh_cache.get("total_pages", 1)
+            if total_pages > 1:
+                _set_total_pages(total_pages)
+            return ORJSONResponse(content=fresh_cache)
 
-    # 缓存过期或不存在，尝试从网站获取
-    result = None
+    # 缓存过期或不存在，尝试从网站获取（并发请求只抓取一次）
+    payload = None
     fetch_error = None
     try:
-        result = await scraper_service.get_video_list(page_num=page)
+        payload = await _fetch_once(cache_key, partial(_scrape_video_list, page))
     except Exception as e:
         fetch_error = e
-        print(f"获取视频列表失败: {e}")
-
-    # 获取成功且有数据
-    if result and result.videos:
-        # 更新总页数缓存
-        if result.total_pages > 1:
-            _total_pages_cache["total_pages"] = result.total_pages
-
-        response = VideoListResponse(
-            videos=result.videos,
-            total=len(result.videos),
-            page=page,
-            total_pages=_total_pages_cache["total_pages"]
-        )
-
-        # 保存到文件缓存
-        if settings.VIDEO_CACHE_ENABLED:
-            await video_cache_service.save_list_cache(page, {
-                "videos": [v.model_dump() for v in result.videos],
-                "total": len(result.videos),
-                "page": page,
-                "total_pages": _total_pages_cache["total_pages"]
-            })
-            # 后台异步下载封面图
-            asyncio.create_task(_download_thumbnails(result.videos))
-            # 后台异步预缓存视频
-            if settings.AUTO_PRECACHE:
-                asyncio.create_task(_precache_videos(result.videos))
-
-        return response
+        logger.warning("获取视频列表失败: %s", e)
+
+    if payload:
+        return ORJSONResponse(content=payload)
 
     # 获取失败或无数据，尝试使用过期的缓存作为兜底
-    if settings.VIDEO_CACHE_ENABLED:
+    if cfg.VIDEO_CACHE_ENABLED:
         file_cached = await video_cache_service.get_cached_list(page)  # 不检查时间
         if file_cached:
-            videos = [VideoItem(**v) for v in file_cached.get("videos", [])]
+            videos = _video_items_adapter.validate_python(file_cached.get("videos", []))
             response = VideoListResponse(
                 videos=videos,
                 total=file_cached.get("total", len(videos)),
@@ -146,8 +281,8 @@ async def get_video_list(page: int = Query(1, ge=1, description="页码")):
             )
             # 更新总页数
             if response.total_pages > 1:
-                _total_pages_cache["total_pages"] = response.total_pages
-            print(f"[Cache] 使用过期缓存兜底: 第{page}页, {len(videos)}个视频")
+                _set_total_pages(response.total_pages)
+            logger.debug("[Cache] 使用过期缓存兜底: 第%s页, %s个视频", page, len(videos))
             return response
 
     # 既无法获取也无缓存
@@ -160,18 +295,21 @@ async def get_video_list(page: int = Query(1, ge=1, description="页码")):
 @router.get("/{video_id}", response_model=VideoDetail)
 async def get_video_detail(video_id: str):
     """获取视频详情"""
-    from ..services.video_cache import video_cache_service
-
     # 如果视频文件已缓存，优先使用持久化的详情缓存
     if video_cache_service.is_cached(video_id):
         cached_detail = await video_cache_service.get_cached_detail(video_id)
         if cached_detail:
             return cached_detail
 
-    # 视频未缓存，每次都重新获取详情（不使用内存缓存）
+    # 视频未缓存，使用短时内存缓存（视频地址会过期）
+    cache_key = f"detail_{video_id}"
+    async with _cache_lock:
+        cached = _detail_cache.get(cache_key)
+    if cached:
+        return cached
+
     try:
-        video_url = f"{settings.TARGET_BASE_URL}/view_video.php?viewkey={video_id}"
-        detail = await scraper_service.get_video_detail(video_url)
+        detail = await _fetch_once(cache_key, partial(_scrape_video_detail, video_id))
 
         if not detail:
             raise HTTPException(status_code=404, detail="视频不存在")
@@ -187,5 +325,8 @@ async def get_video_detail(video_id: str):
 @router.delete("/cache")
 async def clear_cache():
     """清除缓存"""
-    _total_pages_cache["total_pages"] = 1
+    _set_total_pages(1)
+    async with _cache_lock:
+        _list_cache.clear()
+        _detail_cache.clear()
     return {"message": "缓存已清除"}
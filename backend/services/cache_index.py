@@ -0,0 +1,55 @@
+import time
+from typing import Optional, Tuple
+from .database import Database, database
+
+
+class CacheIndex:
+    """缓存的视频详情和列表页（保存在共用的 SQLite 数据库中），代替缓存目录下大量的小JSON文件"""
+
+    def __init__(self, db: Database):
+        self._db = db
+
+    def get_detail(self, viewkey: str) -> Optional[bytes]:
+        """读取视频详情JSON"""
+        row = self._db.get_conn().execute("SELECT json FROM details WHERE viewkey = ?", (viewkey,)).fetchone()
+        return row[0] if row else None
+
+    def put_detail(self, viewkey: str, data: bytes):
+        """保存视频详情JSON"""
+        conn = self._db.get_conn()
+        with self._db.write_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO details (viewkey, json, mtime) VALUES (?, ?, ?)",
+                (viewkey, data, time.time()),
+            )
+
+    def delete_detail(self, viewkey: str):
+        """删除视频详情"""
+        conn = self._db.get_conn()
+        with self._db.write_lock:
+            conn.execute("DELETE FROM details WHERE viewkey = ?", (viewkey,))
+
+    def get_list(self, page: int) -> Optional[Tuple[float, bytes]]:
+        """读取列表页JSON，返回 (保存时间, JSON)"""
+        row = self._db.get_conn().execute("SELECT mtime, json FROM list_pages WHERE page = ?", (page,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put_list(self, page: int, data: bytes, mtime: float):
+        """保存列表页JSON"""
+        conn = self._db.get_conn()
+        with self._db.write_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO list_pages (page, json, mtime) VALUES (?, ?, ?)",
+                (page, data, mtime),
+            )
+
+    def clear(self):
+        """清空所有详情和列表页"""
+        conn = self._db.get_conn()
+        with self._db.write_lock:
+            conn.execute("DELETE FROM details")
+            conn.execute("DELETE FROM list_pages")
+
+
+# 全局单例
+cache_index = CacheIndex(database)
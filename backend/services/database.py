@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+from ..config import settings
+
+
+# 各表结构（首次连接时创建）
+_SCHEMA = (
+    # 视频元数据：视频URL（会过期）和解析得到的详情
+    """
+    CREATE TABLE IF NOT EXISTS video_meta (
+        video_id TEXT PRIMARY KEY,
+        m3u8_url TEXT NOT NULL,
+        expires_at INTEGER NOT NULL,
+        detail_json TEXT
+    )
+    """,
+    # 已缓存视频的详情
+    """
+    CREATE TABLE IF NOT EXISTS details (
+        viewkey TEXT PRIMARY KEY,
+        json BLOB NOT NULL,
+        mtime REAL NOT NULL
+    )
+    """,
+    # 列表页缓存
+    """
+    CREATE TABLE IF NOT EXISTS list_pages (
+        page INTEGER PRIMARY KEY,
+        json BLOB NOT NULL,
+        mtime REAL NOT NULL
+    )
+    """,
+)
+
+
+class Database:
+    """服务共用的 SQLite 数据库，所有表共用一个连接和一把写锁"""
+
+    def __init__(self, db_path: str):
+        self._db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self.write_lock = threading.Lock()
+
+    def get_conn(self) -> sqlite3.Connection:
+        """获取数据库连接（首次使用时建表）"""
+        if self._conn is None:
+            with self.write_lock:
+                if self._conn is None:
+                    self._db_path.parent.mkdir(parents=True, exist_ok=True)
+                    conn = sqlite3.connect(self._db_path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    for statement in _SCHEMA:
+                        conn.execute(statement)
+                    self._conn = conn
+        return self._conn
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.write_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 全局单例
+database = Database(settings.METADATA_DB_PATH)
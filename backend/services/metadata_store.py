@@ -0,0 +1,71 @@
+import logging
+import sqlite3
+import time
+from typing import Optional, Tuple
+from pydantic import ValidationError
+from .database import Database, database
+from ..models.video import VideoDetail
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataStore:
+    """视频元数据持久化存储（保存在共用的 SQLite 数据库中），重启后无需重新解析视频页"""
+
+    def __init__(self, db: Database):
+        self._db = db
+
+    def get(self, video_id: str) -> Optional[Tuple[str, Optional[VideoDetail]]]:
+        """读取未过期的视频URL和详情"""
+        try:
+            row = self._db.get_conn().execute(
+                "SELECT m3u8_url, detail_json FROM video_meta WHERE video_id = ? AND expires_at > ?",
+                (video_id, int(time.time())),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("[Meta] 读取元数据失败 %s: %s", video_id, e)
+            return None
+
+        if not row:
+            return None
+
+        m3u8_url, detail_json = row
+        try:
+            detail = VideoDetail.model_validate_json(detail_json) if detail_json else None
+        except ValidationError as e:
+            # 记录损坏或与当前模型不兼容，删除后按未命中处理
+            logger.warning("[Meta] 元数据无效，已删除 %s: %s", video_id, e)
+            self.delete(video_id)
+            return None
+        return m3u8_url, detail
+
+    def put(self, video_id: str, m3u8_url: str, detail: Optional[VideoDetail], ttl: int):
+        """保存视频URL和详情，ttl 秒后过期"""
+        detail_json = detail.model_dump_json() if detail else None
+        try:
+            conn = self._db.get_conn()
+            with self._db.write_lock:
+                conn.execute(
+                    "INSERT OR REPLACE INTO video_meta (video_id, m3u8_url, expires_at, detail_json) VALUES (?, ?, ?, ?)",
+                    (video_id, m3u8_url, int(time.time()) + ttl, detail_json),
+                )
+        except sqlite3.Error as e:
+            logger.warning("[Meta] 保存元数据失败 %s: %s", video_id, e)
+
+    def delete(self, video_id: Optional[str] = None) -> int:
+        """删除指定视频的元数据，不指定则清空，返回删除的数量"""
+        try:
+            conn = self._db.get_conn()
+            with self._db.write_lock:
+                if video_id:
+                    cursor = conn.execute("DELETE FROM video_meta WHERE video_id = ?", (video_id,))
+                else:
+                    cursor = conn.execute("DELETE FROM video_meta")
+        except sqlite3.Error as e:
+            logger.warning("[Meta] 删除元数据失败 %s: %s", video_id or "*", e)
+            return 0
+        return cursor.rowcount
+
+
+# 全局单例
+metadata_store = MetadataStore(database)
@@ -1,26 +1,82 @@
 import aiohttp
+import asyncio
+from base64 import urlsafe_b64encode
+from functools import lru_cache
+from io import StringIO
 from urllib.parse import urljoin, urlparse
-from typing import Optional
+from typing import AsyncIterator, Optional, Union
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
+# 响应内容为跳转URL时最多跟随的次数
+_MAX_M3U8_REDIRECTS = 5
+
+# 流式转发分片时每次读取的块大小
+_SEGMENT_CHUNK_SIZE = 64 * 1024
+
+# 标签中的 URI="..." 属性（#EXT-X-KEY / #EXT-X-MAP 等）
+_URI_RE = re.compile(r'URI="([^"]+)"')
+
+
+@lru_cache(maxsize=1024)
+def _get_base_url(url: str) -> str:
+    """获取URL的基础路径（直播列表反复刷新时直接命中缓存）"""
+    parsed = urlparse(url)
+    path = parsed.path
+    if "/" in path:
+        path = path.rsplit("/", 1)[0] + "/"
+    return f"{parsed.scheme}://{parsed.netloc}{path}"
+
+
+def _join_url(base_url: str, ref: str) -> str:
+    """拼接相对地址，常见的同目录文件名直接拼接，其余情况交给 urljoin"""
+    if base_url.endswith("/") and ref[0] not in "/." and ":" not in ref:
+        return base_url + ref
+    return urljoin(base_url, ref)
+
+
+@lru_cache(maxsize=4096)
+def _encode_proxy(original_url: str, proxy_base_url: str) -> str:
+    """生成分片代理URL（热门播放列表反复重写时直接命中缓存）"""
+    return f"{proxy_base_url}/api/stream/segment/{urlsafe_b64encode(original_url.encode()).decode()}"
+
 
 class ProxyService:
     """M3U8代理服务"""
 
     def __init__(self):
         self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
 
     async def get_session(self) -> aiohttp.ClientSession:
         """获取HTTP会话"""
         if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession(
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    "Accept": "*/*",
-                    "Accept-Language": "en-US,en;q=0.9",
-                    "Cookie": "language=cn_CN",
-                }
-            )
+            async with self._session_lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=256,  # 最大连接数（预缓存 + 分片代理并发）
+                        limit_per_host=32,  # 每个主机最大连接数，避免单个源站被打满
+                        ttl_dns_cache=300,  # DNS缓存时间
+                        use_dns_cache=True,
+                        keepalive_timeout=60,  # 长连接保持，减少重复握手
+                        enable_cleanup_closed=True,
+                    )
+                    self._session = aiohttp.ClientSession(
+                        connector=connector,
+                        timeout=aiohttp.ClientTimeout(
+                            total=None,  # 不限制总时间（大分片/慢源站）
+                            connect=10,  # 连接超时10秒
+                            sock_read=30,  # 读取超时30秒
+                        ),
+                        headers={
+                            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                            "Accept": "*/*",
+                            "Accept-Language": "en-US,en;q=0.9",
+                            "Cookie": "language=cn_CN",
+                        }
+                    )
         return self._session
 
     async def close(self):
@@ -28,45 +84,54 @@ class ProxyService:
         if self._session and not self._session.closed:
             await self._session.close()
 
-    async def fetch_m3u8(self, m3u8_url: str, proxy_base_url: str) -> str:
-        """获取并重写m3u8文件"""
+    async def fetch_m3u8(self, m3u8_url: str, proxy_base_url: str) -> tuple[str, str]:
+        """获取并重写m3u8文件，返回 (重写后内容, 原始内容)"""
         session = await self.get_session()
 
-        print(f"正在获取m3u8: {m3u8_url}")
+        url = m3u8_url
+        for _ in range(_MAX_M3U8_REDIRECTS):
+            logger.debug("正在获取m3u8: %s", url)
 
-        async with session.get(m3u8_url) as response:
-            if response.status != 200:
-                raise Exception(f"获取m3u8失败: {response.status}")
+            async with session.get(url) as response:
+                if response.status != 200:
+                    raise Exception(f"获取m3u8失败: {response.status}")
+
+                content = await response.text()
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("m3u8原始内容前500字符:\n%s", content[:500])
 
-            content = await response.text()
-            print(f"m3u8原始内容前500字符:\n{content[:500]}")
+            # 检查是否真的是m3u8格式
+            stripped = content.lstrip()
+            if stripped.startswith("#EXTM3U"):
+                break
 
-        # 检查是否真的是m3u8格式
-        if not content.strip().startswith("#EXTM3U"):
-            print("警告: 内容不是标准m3u8格式")
+            logger.warning("内容不是标准m3u8格式: %s", url)
             # 可能是重定向URL
-            if content.strip().startswith("http"):
-                print(f"检测到重定向URL: {content.strip()}")
-                return await self.fetch_m3u8(content.strip().split()[0], proxy_base_url)
+            if stripped.startswith("http"):
+                url = stripped.split(None, 1)[0]
+                logger.debug("检测到重定向URL: %s", url)
+                continue
             # 不是m3u8格式，抛出异常让调用方处理为MP4
             raise Exception("内容不是m3u8格式，可能是MP4文件")
+        else:
+            raise Exception(f"m3u8重定向次数过多: {m3u8_url}")
 
         # 重写m3u8内容
-        result = self._rewrite_m3u8(content, m3u8_url, proxy_base_url)
-        print(f"m3u8重写后内容前500字符:\n{result[:500]}")
-        return result
+        result = self._rewrite_m3u8(content, url, proxy_base_url)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("m3u8重写后内容前500字符:\n%s", result[:500])
+        return result, content
 
     def _rewrite_m3u8(self, content: str, original_url: str, proxy_base_url: str) -> str:
         """重写m3u8文件中的URL"""
-        lines = content.split("\n")
-        new_lines = []
+        buf = StringIO()
         base_url = self._get_base_url(original_url)
 
-        for line in lines:
+        for line in content.splitlines():
             line = line.strip()
 
             if not line:
-                new_lines.append(line)
+                buf.write("\n")
                 continue
 
             # 跳过注释行但保留
@@ -74,61 +139,54 @@ class ProxyService:
                 # 处理 #EXT-X-KEY 等包含URI的行
                 if "URI=" in line:
                     line = self._rewrite_uri_in_tag(line, base_url, proxy_base_url)
-                new_lines.append(line)
+                buf.write(line)
+                buf.write("\n")
                 continue
 
             # 非注释行都当作资源URL处理
             # 转换为绝对URL
             if not line.startswith("http"):
-                absolute_url = urljoin(base_url, line)
+                absolute_url = _join_url(base_url, line)
             else:
                 absolute_url = line
 
             # 生成代理URL
-            proxy_url = self._create_proxy_url(absolute_url, proxy_base_url)
-            new_lines.append(proxy_url)
+            buf.write(self._create_proxy_url(absolute_url, proxy_base_url))
+            buf.write("\n")
 
-        return "\n".join(new_lines)
+        return buf.getvalue()
 
     def _rewrite_uri_in_tag(self, line: str, base_url: str, proxy_base_url: str) -> str:
         """重写标签中的URI"""
-        uri_match = re.search(r'URI="([^"]+)"', line)
-        if uri_match:
-            original_uri = uri_match.group(1)
+        def replace_uri(match: re.Match) -> str:
+            original_uri = match.group(1)
             if not original_uri.startswith("http"):
-                absolute_uri = urljoin(base_url, original_uri)
+                absolute_uri = _join_url(base_url, original_uri)
             else:
                 absolute_uri = original_uri
-            proxy_uri = self._create_proxy_url(absolute_uri, proxy_base_url)
-            line = line.replace(f'URI="{original_uri}"', f'URI="{proxy_uri}"')
-        return line
+            return f'URI="{self._create_proxy_url(absolute_uri, proxy_base_url)}"'
+
+        return _URI_RE.sub(replace_uri, line, count=1)
 
     def _get_base_url(self, url: str) -> str:
         """获取URL的基础路径"""
-        parsed = urlparse(url)
-        path = parsed.path
-        if "/" in path:
-            path = path.rsplit("/", 1)[0] + "/"
-        return f"{parsed.scheme}://{parsed.netloc}{path}"
+        return _get_base_url(url)
 
     def _create_proxy_url(self, original_url: str, proxy_base_url: str) -> str:
         """创建代理URL"""
-        from base64 import urlsafe_b64encode
-        encoded = urlsafe_b64encode(original_url.encode()).decode()
-        return f"{proxy_base_url}/api/stream/segment/{encoded}"
+        return _encode_proxy(original_url, proxy_base_url)
 
-    async def fetch_segment(self, segment_url: str) -> tuple[bytes, str]:
-        """获取ts分片或其他资源"""
+    async def fetch_segment_stream(self, segment_url: str) -> AsyncIterator[Union[str, bytes]]:
+        """流式获取ts分片：先产出 Content-Type，之后逐块产出内容"""
         session = await self.get_session()
 
         async with session.get(segment_url) as response:
             if response.status != 200:
                 raise Exception(f"获取分片失败: {response.status}")
 
-            content = await response.read()
-            content_type = response.headers.get("Content-Type", "video/MP2T")
-
-        return content, content_type
+            yield response.headers.get("Content-Type", "video/MP2T")
+            async for chunk in response.content.iter_chunked(_SEGMENT_CHUNK_SIZE):
+                yield chunk
 
 
 # 全局单例
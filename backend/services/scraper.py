@@ -1,11 +1,17 @@
 import asyncio
 import json
+import os
 import re
+import shutil
 import time
+import traceback
+from contextlib import asynccontextmanager
+from functools import partial
 from pathlib import Path
-from typing import List, Optional
-from urllib.parse import urljoin, urlparse, parse_qs
+from typing import AsyncIterator, List, Optional
+from urllib.parse import urljoin, urlparse
 from playwright.async_api import async_playwright, Browser, Page, BrowserContext
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from ..config import settings
 from ..models.video import VideoItem, VideoDetail
 
@@ -13,6 +19,195 @@ from ..models.video import VideoItem, VideoDetail
 # Cookies存储文件
 COOKIES_FILE = Path(__file__).parent.parent / "cookies.json"
 
+# 默认 cookie（中文界面）
+DEFAULT_COOKIES = [{
+    "name": "language",
+    "value": "cn_CN",
+    "domain": ".91porn.com",
+    "path": "/"
+}]
+
+
+# 视频ID（viewkey 参数）
+VIEWKEY_RE = re.compile(r"viewkey=([A-Za-z0-9]+)")
+# 视频链接中多余的斜杠 (如 .com//mp43/)
+DOUBLE_SLASH_RE = re.compile(r"\.com//+")
+
+# CDP 连接失败时的重试次数（间隔 1, 2, 4, 8 秒指数退避）
+CDP_CONNECT_RETRIES = 5
+
+# /dev/shm 小于该值时让 Chromium 改用 /tmp 存放共享内存（Docker 默认只有 64MB）
+MIN_DEV_SHM_SIZE = 256 * 1024 * 1024
+
+# 总页数缓存有效期（秒）
+TOTAL_PAGES_TTL = 3600
+
+# 列表页视频卡片所在的列容器 / 视频页的视频元素（出现即可开始提取）
+LIST_ITEM_SELECTOR = ".col-xs-12.col-sm-4.col-md-3.col-lg-3"
+DETAIL_VIDEO_SELECTOR = ".video-container source, .video-container video, video"
+# 页面中没有视频地址时，等待播放器发出 m3u8 请求的最长时间（毫秒）
+DETAIL_M3U8_WAIT_MS = 5000
+
+# 视频页信息提取脚本：一次返回视频链接（按优先级分两档）、标题和封面
+DETAIL_EXTRACT_JS = """
+() => {
+    const attr = (selector, name) => {
+        const el = document.querySelector(selector);
+        return el ? el.getAttribute(name) : null;
+    };
+    const titleEl = document.querySelector('h4, .video-title, #viewvideo-title');
+    return {
+        container_src: attr('.video-container source', 'src') || attr('.video-container video', 'src'),
+        any_src: attr('video source', 'src') || attr('video', 'src'),
+        title: titleEl ? titleEl.innerText : document.title,
+        poster: attr('video', 'poster'),
+    };
+}
+"""
+
+# 列表页提取函数，作为初始化脚本注入每个页面，抓取时只需调用，无需每次传输和编译整段脚本
+# __extractList: 从主列表的列容器中提取视频卡片
+# __extractPages: 总页数，依次尝试分页链接中的最大页码 / "共X页"文本 / 最后一页链接的 page 参数
+EXTRACTOR_JS = r"""
+window.__extractList = () => {
+    const videos = [];
+    const seen = new Set();
+
+    for (const col of document.querySelectorAll('.col-xs-12.col-sm-4.col-md-3.col-lg-3')) {
+        // 在列容器内找视频卡片
+        const card = col.querySelector('.well.well-sm.videos-text-align');
+        if (!card) continue;
+
+        const link = card.querySelector('a[href*="viewkey"]');
+        if (!link) continue;
+
+        const href = link.href;
+        const match = href.match(/viewkey=([a-zA-Z0-9]+)/);
+        if (!match) continue;
+
+        const videoId = match[1];
+        if (seen.has(videoId)) continue;
+
+        const img = card.querySelector('.thumb-overlay img, img.img-responsive');
+        const titleEl = card.querySelector('.video-title');
+        const durationEl = card.querySelector('.duration');
+
+        seen.add(videoId);
+        videos.push({
+            id: videoId,
+            title: titleEl ? titleEl.innerText?.trim() : (link.title || 'Video'),
+            thumbnail: img ? img.src : null,
+            url: href,
+            duration: durationEl ? durationEl.innerText?.trim() : null
+        });
+    }
+
+    return videos;
+};
+
+window.__extractPages = () => {
+    let max = 1;
+    for (const a of document.querySelectorAll('.pagination a, .pagingnav a')) {
+        const text = a.innerText.trim();
+        if (/^\d+$/.test(text)) max = Math.max(max, parseInt(text, 10));
+    }
+    if (max > 1) return max;
+
+    const total = document.documentElement.outerHTML.match(/共\s*(\d+)\s*页/);
+    if (total) return parseInt(total[1], 10);
+
+    const last = document.querySelector('.pagination li:last-child a, .pagingnav a:last-child');
+    const href = last ? last.getAttribute('href') : null;
+    const m = href ? href.match(/page=(\d+)/) : null;
+    return m ? parseInt(m[1], 10) : 1;
+};
+"""
+
+# 从页面 HTML 中匹配视频链接（先 mp4 后 m3u8），避免把整个页面序列化传回再匹配
+CONTENT_URL_JS = r"""
+() => {
+    const html = document.documentElement.outerHTML;
+    const m = html.match(/https?:\/\/[^\s"'<>]+\.mp4[^\s"'<>]*/) || html.match(/https?:\/\/[^\s"'<>]+\.m3u8[^\s"'<>]*/);
+    return m ? m[0] : null;
+}
+"""
+
+# 解析页面时不需要加载的资源类型（只需要 DOM 和视频地址）
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font", "stylesheet"})
+# 统计/广告域名，直接拦截
+BLOCKED_HOSTS = ("doubleclick.net", "google-analytics.com", "googletagmanager.com", "cloudflareinsights.com")
+# Cloudflare 验证页面需要完整加载，不拦截
+CHALLENGE_HOST = "challenges.cloudflare.com"
+
+
+async def _route_filter(route):
+    """拦截图片/视频/字体/样式和统计请求，减少页面加载的流量和时间"""
+    request = route.request
+    host = urlparse(request.url).hostname or ""
+    if host.endswith(CHALLENGE_HOST):
+        await route.continue_()
+    elif request.resource_type in BLOCKED_RESOURCE_TYPES or host.endswith(BLOCKED_HOSTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+# 增强反检测脚本
+STEALTH_JS = """
+// 隐藏 webdriver
+Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
+
+// 模拟插件
+Object.defineProperty(navigator, 'plugins', {
+    get: () => {
+        const plugins = [
+            { name: 'Chrome PDF Plugin', filename: 'internal-pdf-viewer' },
+            { name: 'Chrome PDF Viewer', filename: 'mhjfbmdgcfjbbpaeojofohoefgiehjai' },
+            { name: 'Native Client', filename: 'internal-nacl-plugin' }
+        ];
+        plugins.length = 3;
+        return plugins;
+    }
+});
+
+// 语言
+Object.defineProperty(navigator, 'languages', { get: () => ['zh-CN', 'zh', 'en-US', 'en'] });
+
+// Chrome 对象
+window.chrome = {
+    runtime: {},
+    loadTimes: function() {},
+    csi: function() {},
+    app: {}
+};
+
+// 权限查询
+const originalQuery = window.navigator.permissions.query;
+window.navigator.permissions.query = (parameters) => (
+    parameters.name === 'notifications' ?
+        Promise.resolve({ state: Notification.permission }) :
+        originalQuery(parameters)
+);
+
+// WebGL 渲染器
+const getParameter = WebGLRenderingContext.prototype.getParameter;
+WebGLRenderingContext.prototype.getParameter = function(parameter) {
+    if (parameter === 37445) return 'Intel Inc.';
+    if (parameter === 37446) return 'Intel Iris OpenGL Engine';
+    return getParameter.apply(this, arguments);
+};
+
+// 隐藏自动化特征
+delete navigator.__proto__.webdriver;
+"""
+
+
+def _write_cookies_sync(data: str):
+    """原子写入cookies文件（同步，需在线程中调用）"""
+    tmp_path = COOKIES_FILE.with_suffix(".tmp")
+    tmp_path.write_text(data)
+    os.replace(tmp_path, COOKIES_FILE)
+
 
 class VideoListResult:
     """视频列表结果"""
@@ -27,51 +222,56 @@ class ScraperService:
     def __init__(self):
         self._playwright = None
         self._browser: Optional[Browser] = None
-        self._context: Optional[BrowserContext] = None
-        self._page: Optional[Page] = None
-        self._lock = asyncio.Lock()
-        self._current_page_num = 0  # 当前所在页码
-        self._pending_requests = 0  # 正在进行的请求数
-
-    def load_cookies(self) -> list:
+        self._context: Optional[BrowserContext] = None  # 主上下文（CDP 模式为浏览器默认上下文）
+        self._contexts: List[BrowserContext] = []  # 本服务创建的全部上下文
+        self._ctx_pool: Optional[asyncio.Queue] = None  # 可用上下文池，每个请求独占一个
+        self._init_lock = asyncio.Lock()
+        self._total_pages_cache: Optional[int] = None  # 缓存的总页数
+        self._total_pages_ts: float = 0  # 总页数缓存时间
+        # 进行中的抓取: 页面键 -> 抓取任务（播放、预缓存等不同路径并发请求同一页面时只打开一次浏览器页面）
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def load_cookies(self) -> list:
         """从文件加载cookies"""
-        if COOKIES_FILE.exists():
-            try:
-                with open(COOKIES_FILE, "r") as f:
-                    return json.load(f)
-            except:
-                pass
-        return []
+        try:
+            return json.loads(await asyncio.to_thread(COOKIES_FILE.read_bytes))
+        except (OSError, ValueError):
+            return []
 
-    def save_cookies(self, cookies: list):
-        """保存cookies到文件"""
-        with open(COOKIES_FILE, "w") as f:
-            json.dump(cookies, f)
+    async def save_cookies(self, cookies: list):
+        """保存cookies到文件（先写临时文件再替换，中途崩溃不会留下空文件）"""
+        await asyncio.to_thread(_write_cookies_sync, json.dumps(cookies))
 
     async def initialize(self):
         """初始化Playwright浏览器"""
         if self._browser is None:
-            self._playwright = await async_playwright().start()
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
 
             if settings.BROWSER_MODE == "cdp":
                 # CDP模式：连接到已运行的Chrome
                 try:
-                    print(f"尝试连接到已运行的Chrome ({settings.CDP_URL})...")
-                    self._browser = await self._playwright.chromium.connect_over_cdp(settings.CDP_URL)
+                    # Chrome 可能正在启动或重启，连接失败时退避重试
+                    for i in range(CDP_CONNECT_RETRIES):
+                        print(f"尝试连接到已运行的Chrome ({settings.CDP_URL})...")
+                        try:
+                            self._browser = await self._playwright.chromium.connect_over_cdp(settings.CDP_URL)
+                            break
+                        except Exception as e:
+                            if i == CDP_CONNECT_RETRIES - 1:
+                                raise
+                            print(f"连接失败，{2 ** i}秒后重试: {e}")
+                            await asyncio.sleep(2 ** i)
+                    self._browser.on("disconnected", self._on_disconnected)
                     self._context = self._browser.contexts[0]
 
-                    if self._context.pages:
-                        self._page = self._context.pages[0]
-                    else:
-                        self._page = await self._context.new_page()
-
                     # 添加默认 cookie
-                    await self._context.add_cookies([{
-                        "name": "language",
-                        "value": "cn_CN",
-                        "domain": ".91porn.com",
-                        "path": "/"
-                    }])
+                    await self._context.add_cookies(DEFAULT_COOKIES)
+
+                    # 复用浏览器默认上下文（保留已通过验证的 cookies），每个请求在其中打开独立标签页
+                    self._ctx_pool = asyncio.Queue()
+                    for _ in range(settings.SCRAPER_MAX_CONCURRENCY):
+                        self._ctx_pool.put_nowait(self._context)
 
                     print("成功连接到Chrome!")
                 except Exception as e:
@@ -88,98 +288,65 @@ class ScraperService:
                     "args": [
                         "--disable-features=TranslateUI",
                         "--disable-background-networking",
-                        "--disable-dev-shm-usage",
                         "--no-sandbox",
+                        "--disable-gpu",
+                        "--disable-software-rasterizer",
+                        "--mute-audio",
+                        "--disable-blink-features=AutomationControlled",
                     ],
                 }
 
+                # /dev/shm 足够大时直接使用，比落到磁盘上的 /tmp 快
+                try:
+                    shm_size = shutil.disk_usage("/dev/shm").total
+                except OSError:
+                    shm_size = 0
+                if shm_size < MIN_DEV_SHM_SIZE:
+                    launch_options["args"].append("--disable-dev-shm-usage")
+
                 # 如果配置了代理
                 if settings.BROWSER_PROXY:
                     launch_options["proxy"] = {"server": settings.BROWSER_PROXY}
                     print(f"使用代理: {settings.BROWSER_PROXY}")
 
                 self._browser = await self._playwright.chromium.launch(**launch_options)
-                self._context = await self._browser.new_context(
-                    viewport={"width": 1920, "height": 1080},
-                    user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    locale="zh-CN",
-                    timezone_id="Asia/Shanghai",
-                )
+                self._browser.on("disconnected", self._on_disconnected)
+
+                # 预先创建上下文池，每个请求独占一个上下文，互不阻塞
+                saved_cookies = await self.load_cookies()
+                self._contexts = [await self._new_context(saved_cookies) for _ in range(settings.SCRAPER_MAX_CONCURRENCY)]
+                self._context = self._contexts[0]
+                self._ctx_pool = asyncio.Queue()
+                for context in self._contexts:
+                    self._ctx_pool.put_nowait(context)
+                print("浏览器启动成功!")
 
-                # 增强反检测脚本
-                await self._context.add_init_script("""
-                    // 隐藏 webdriver
-                    Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
-
-                    // 模拟插件
-                    Object.defineProperty(navigator, 'plugins', {
-                        get: () => {
-                            const plugins = [
-                                { name: 'Chrome PDF Plugin', filename: 'internal-pdf-viewer' },
-                                { name: 'Chrome PDF Viewer', filename: 'mhjfbmdgcfjbbpaeojofohoefgiehjai' },
-                                { name: 'Native Client', filename: 'internal-nacl-plugin' }
-                            ];
-                            plugins.length = 3;
-                            return plugins;
-                        }
-                    });
-
-                    // 语言
-                    Object.defineProperty(navigator, 'languages', { get: () => ['zh-CN', 'zh', 'en-US', 'en'] });
-
-                    // Chrome 对象
-                    window.chrome = {
-                        runtime: {},
-                        loadTimes: function() {},
-                        csi: function() {},
-                        app: {}
-                    };
-
-                    // 权限查询
-                    const originalQuery = window.navigator.permissions.query;
-                    window.navigator.permissions.query = (parameters) => (
-                        parameters.name === 'notifications' ?
-                            Promise.resolve({ state: Notification.permission }) :
-                            originalQuery(parameters)
-                    );
-
-                    // WebGL 渲染器
-                    const getParameter = WebGLRenderingContext.prototype.getParameter;
-                    WebGLRenderingContext.prototype.getParameter = function(parameter) {
-                        if (parameter === 37445) return 'Intel Inc.';
-                        if (parameter === 37446) return 'Intel Iris OpenGL Engine';
-                        return getParameter.apply(this, arguments);
-                    };
-
-                    // 隐藏自动化特征
-                    delete navigator.__proto__.webdriver;
-                """)
-
-                # 添加默认 cookie
-                await self._context.add_cookies([{
-                    "name": "language",
-                    "value": "cn_CN",
-                    "domain": ".91porn.com",
-                    "path": "/"
-                }])
+    def _on_disconnected(self, browser: Browser):
+        """浏览器连接断开（Chrome 重启或崩溃），丢弃失效的上下文，下次请求时重新连接"""
+        if browser is not self._browser:
+            return
+        print("浏览器连接已断开，下次请求时重新连接")
+        self._browser = None
+        self._context = None
+        self._contexts = []
+        self._ctx_pool = None
+
+    async def _new_context(self, saved_cookies: list) -> BrowserContext:
+        """创建浏览器上下文（自动模式），带反检测脚本和已保存的 cookies"""
+        context = await self._browser.new_context(
+            viewport={"width": 1920, "height": 1080},
+            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            locale="zh-CN",
+            timezone_id="Asia/Shanghai",
+        )
 
-                self._page = await self._context.new_page()
-                print("浏览器启动成功!")
+        # 增强反检测脚本、列表页提取函数
+        await context.add_init_script(STEALTH_JS)
+        await context.add_init_script(EXTRACTOR_JS)
 
-    async def _inject_stealth(self, page: Page):
-        """注入stealth脚本"""
-        await page.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
-            Object.defineProperty(navigator, 'plugins', { get: () => [1, 2, 3, 4, 5] });
-            Object.defineProperty(navigator, 'languages', { get: () => ['zh-CN', 'zh', 'en'] });
-            window.chrome = { runtime: {} };
-            const originalQuery = window.navigator.permissions.query;
-            window.navigator.permissions.query = (parameters) => (
-                parameters.name === 'notifications' ?
-                    Promise.resolve({ state: Notification.permission }) :
-                    originalQuery(parameters)
-            );
-        """)
+        # 添加默认 cookie 和已保存的 cookies
+        await context.add_cookies(DEFAULT_COOKIES + saved_cookies)
+        return context
 
     async def set_cookies_from_string(self, cookie_string: str):
         """从字符串设置cookies (格式: name=value; name2=value2)"""
@@ -196,33 +363,39 @@ class ScraperService:
                 })
 
         if cookies:
-            self.save_cookies(cookies)
-            if self._context:
-                await self._context.add_cookies(cookies)
+            await self.save_cookies(cookies)
+            for context in self._contexts or ([self._context] if self._context else []):
+                await context.add_cookies(cookies)
             print(f"已设置 {len(cookies)} 个cookies")
         return len(cookies)
 
     async def _save_current_cookies(self):
-        """保存当前浏览器的cookies"""
-        if self._context:
+        """保存当前浏览器的cookies（合并上下文池中所有上下文）"""
+        contexts = self._contexts or ([self._context] if self._context else [])
+        if contexts:
             try:
-                cookies = await self._context.cookies()
-                # 只保存91porn相关的cookies
-                filtered = [c for c in cookies if "91porn" in c.get("domain", "")]
+                # 只保存91porn相关的cookies，同名 cookie 以后面的上下文为准
+                merged = {}
+                for context in contexts:
+                    for c in await context.cookies():
+                        if "91porn" in c.get("domain", ""):
+                            merged[(c["name"], c["domain"], c["path"])] = c
+                filtered = list(merged.values())
                 if filtered:
-                    self.save_cookies(filtered)
+                    await self.save_cookies(filtered)
                     print(f"自动保存了 {len(filtered)} 个cookies")
             except Exception as e:
                 print(f"保存cookies失败: {e}")
 
     async def close(self):
         """关闭浏览器"""
-        if self._page:
-            await self._page.close()
-            self._page = None
-        if self._context:
-            await self._context.close()
-            self._context = None
+        # 关闭前保存一次cookies（运行期间只在通过验证后保存）
+        await self._save_current_cookies()
+        self._ctx_pool = None
+        for context in self._contexts:
+            await context.close()
+        self._contexts = []
+        self._context = None
         if self._browser:
             await self._browser.close()
             self._browser = None
@@ -230,16 +403,45 @@ class ScraperService:
             await self._playwright.stop()
             self._playwright = None
 
-    async def _get_page(self) -> Page:
-        """获取页面（复用同一个页面）"""
-        async with self._lock:
-            if self._page is None:
-                await self.initialize()
-            return self._page
+    @asynccontextmanager
+    async def _acquire_page(self) -> AsyncIterator[Page]:
+        """从上下文池取一个上下文并打开新页面，用完关闭页面并归还上下文"""
+        if self._ctx_pool is None:
+            async with self._init_lock:
+                if self._ctx_pool is None:
+                    await self.initialize()
+
+        pool = self._ctx_pool
+        context = await pool.get()
+        try:
+            page = await context.new_page()
+            try:
+                # 只拦截本服务打开的页面（CDP 模式下不影响浏览器里手动打开的标签页）
+                if settings.SCRAPER_BLOCK_RESOURCES:
+                    await page.route("**/*", _route_filter)
+                # CDP 模式复用浏览器默认上下文，提取函数只注入本服务打开的页面
+                if settings.BROWSER_MODE == "cdp":
+                    await page.add_init_script(EXTRACTOR_JS)
+                yield page
+            finally:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+        finally:
+            pool.put_nowait(context)
 
     async def get_video_list(self, page_num: int = 1) -> VideoListResult:
         """获取视频列表"""
-        page = await self._get_page()
+        return await self._fetch_once(f"list_{page_num}", partial(self._load_video_list, page_num))
+
+    async def _load_video_list(self, page_num: int) -> VideoListResult:
+        """打开页面抓取视频列表"""
+        async with self._acquire_page() as page:
+            return await self._scrape_video_list(page, page_num)
+
+    async def _scrape_video_list(self, page: Page, page_num: int) -> VideoListResult:
+        """在给定页面中抓取视频列表"""
         videos = []
         total_pages = 1
 
@@ -249,12 +451,15 @@ class ScraperService:
             list_url = f"{list_url}&page={page_num}"
             print(f"正在访问第{page_num}页: {list_url}")
 
-            # 使用domcontentloaded而不是networkidle，避免超时
-            await page.goto(list_url, wait_until="domcontentloaded", timeout=30000)
+            # 收到响应即返回，不等整个文档解析完，由下面等待视频卡片出现
+            await page.goto(list_url, wait_until="commit", timeout=30000)
 
-            # 等待页面加载，如果遇到Cloudflare验证，用户可以手动完成
+            # 等待视频卡片出现，如果遇到Cloudflare验证，用户可以手动完成
             print("等待页面加载...如果看到验证页面请手动完成")
-            await asyncio.sleep(5)
+            try:
+                await page.wait_for_selector(LIST_ITEM_SELECTOR, state="attached", timeout=15000)
+            except PlaywrightTimeoutError:
+                pass
 
             # 检查是否遇到Cloudflare，等待用户验证
             for i in range(30):  # 最多等待30秒让用户完成验证
@@ -263,228 +468,103 @@ class ScraperService:
                     print(f"检测到验证页面，等待用户完成验证... ({i+1}/30)")
                     await asyncio.sleep(1)
                 else:
+                    if i > 0:
+                        # 刚通过验证，保存新的验证 cookies，并等待真正的列表页加载
+                        await self._save_current_cookies()
+                        try:
+                            await page.wait_for_selector(LIST_ITEM_SELECTOR, state="attached", timeout=8000)
+                        except PlaywrightTimeoutError:
+                            pass
                     break
 
-            self._current_page_num = page_num
-
-            # 保存当前cookies
-            await self._save_current_cookies()
-
             # 再次检查是否遇到Cloudflare
             title = await page.title()
             print(f"页面标题: {title}")
 
             if "cloudflare" in title.lower() or "just a moment" in title.lower():
                 print("警告: 遇到Cloudflare验证页面，请在设置中更新cookies")
-                self._current_page_num = 0  # 重置页码
                 return VideoListResult(videos=[], total_pages=1)
 
-            # 获取总页数
-            total_pages = await self._get_total_pages(page)
+            # 提取视频列表，同时获取总页数（两次调用并发执行）
+            # 总页数在一段时间内基本不变，缓存后跳过分页控件解析
+            extract_list = page.evaluate("() => window.__extractList()")
+            if self._total_pages_cache and time.time() - self._total_pages_ts < TOTAL_PAGES_TTL:
+                total_pages = self._total_pages_cache
+                videos_data = await extract_list
+            else:
+                videos_data, total_pages = await asyncio.gather(extract_list, self._get_total_pages(page))
+                if total_pages > 1:
+                    self._total_pages_cache = total_pages
+                    self._total_pages_ts = time.time()
             print(f"总页数: {total_pages}")
 
-            # 使用 JavaScript 直接提取视频列表数据
-            # 先选择主列表的容器 .col-xs-12.col-sm-4.col-md-3.col-lg-3
-            videos_data = await page.evaluate("""
-                () => {
-                    const videos = [];
-                    const seen = new Set();
-
-                    // 选择主列表的列容器
-                    const columns = document.querySelectorAll('.col-xs-12.col-sm-4.col-md-3.col-lg-3');
-                    console.log('找到列容器数:', columns.length);
-
-                    for (const col of columns) {
-                        // 在列容器内找视频卡片
-                        const card = col.querySelector('.well.well-sm.videos-text-align');
-                        if (!card) continue;
-
-                        // 找链接
-                        const link = card.querySelector('a[href*="viewkey"]');
-                        if (!link) continue;
-
-                        const href = link.href;
-                        const match = href.match(/viewkey=([a-zA-Z0-9]+)/);
-                        if (!match) continue;
-
-                        const videoId = match[1];
-                        if (seen.has(videoId)) continue;
-
-                        // 在卡片内找图片
-                        const img = card.querySelector('.thumb-overlay img, img.img-responsive');
-                        let thumbnail = img ? img.src : null;
-
-                        // 获取标题
-                        const titleEl = card.querySelector('.video-title');
-                        let title = titleEl ? titleEl.innerText?.trim() : (link.title || 'Video');
-
-                        // 获取时长
-                        const durationEl = card.querySelector('.duration');
-                        const duration = durationEl ? durationEl.innerText?.trim() : null;
-
-                        seen.add(videoId);
-                        videos.push({
-                            id: videoId,
-                            title: title,
-                            thumbnail: thumbnail,
-                            url: href,
-                            duration: duration
-                        });
-                    }
-
-                    return videos;
-                }
-            """)
-
             print(f"JavaScript 提取到 {len(videos_data)} 个视频")
 
-            for v in videos_data:
-                videos.append(VideoItem(
+            videos = [
+                VideoItem(
                     id=v['id'],
-                    title=v['title'] or f"Video",
+                    title=v['title'] or "Video",
                     thumbnail=v['thumbnail'],
                     url=v['url'],
                     duration=v['duration']
-                ))
-                # print(f"视频 {v['id']} 缩略图: {v['thumbnail']}")
+                )
+                for v in videos_data
+            ]
 
         except Exception as e:
             print(f"获取视频列表失败: {e}")
-            import traceback
             traceback.print_exc()
 
         return VideoListResult(videos=videos, total_pages=total_pages)
 
     async def _get_total_pages(self, page: Page) -> int:
         """从分页控件获取总页数"""
-        total_pages = 1
         try:
-            # 方法1: 查找分页链接中的最大页码
-            pagination_links = await page.query_selector_all(".pagination a, .pagingnav a")
-            max_page = 1
-            for link in pagination_links:
-                text = await link.inner_text()
-                text = text.strip()
-                if text.isdigit():
-                    max_page = max(max_page, int(text))
-            if max_page > 1:
-                total_pages = max_page
-
-            # 方法2: 查找"共X页"文本
-            if total_pages == 1:
-                content = await page.content()
-                import re
-                match = re.search(r'共\s*(\d+)\s*页', content)
-                if match:
-                    total_pages = int(match.group(1))
-
-            # 方法3: 查找最后一页链接
-            if total_pages == 1:
-                last_link = await page.query_selector(".pagination li:last-child a, .pagingnav a:last-child")
-                if last_link:
-                    href = await last_link.get_attribute("href")
-                    if href:
-                        match = re.search(r'page=(\d+)', href)
-                        if match:
-                            total_pages = int(match.group(1))
-
+            return int(await page.evaluate("() => window.__extractPages()"))
         except Exception as e:
             print(f"获取总页数失败: {e}")
-
-        return total_pages
-
-    async def _parse_video_item(self, element, index: int) -> Optional[VideoItem]:
-        """解析单个视频项"""
-        # 获取链接元素 - 可能是元素本身或子元素
-        tag_name = await element.evaluate("el => el.tagName.toLowerCase()")
-
-        if tag_name == "a":
-            link_el = element
-            # 如果是 <a> 标签，尝试获取父容器来找图片
-            parent_el = await element.evaluate_handle("el => el.closest('.well, .col-xs-12, .video-item') || el.parentElement")
-        else:
-            link_el = await element.query_selector("a")
-            parent_el = element
-
-        if not link_el:
-            return None
-
-        href = await link_el.get_attribute("href")
-        if not href or "viewkey" not in href:
-            return None
-
-        url = urljoin(settings.TARGET_BASE_URL, href)
-
-        # 从URL中提取视频ID (viewkey参数)
-        parsed = urlparse(url)
-        query_params = parse_qs(parsed.query)
-        video_id = query_params.get("viewkey", [str(index)])[0]
-
-        # 获取缩略图 - 优先从父容器查找
-        thumbnail = None
-        img_el = await parent_el.query_selector("img") if parent_el else None
-        if not img_el:
-            img_el = await element.query_selector("img")
-        if not img_el:
-            img_el = await link_el.query_selector("img")
-
-        if img_el:
-            thumbnail = await img_el.get_attribute("src")
-            if not thumbnail or "loading" in thumbnail.lower() or "placeholder" in thumbnail.lower():
-                thumbnail = await img_el.get_attribute("data-src")
-            if not thumbnail:
-                thumbnail = await img_el.get_attribute("data-original")
-            # 过滤掉明显的占位图
-            if thumbnail and ("data:image" in thumbnail or "blank" in thumbnail.lower() or "spacer" in thumbnail.lower()):
-                thumbnail = await img_el.get_attribute("data-src") or await img_el.get_attribute("data-original")
-            if thumbnail and not thumbnail.startswith("http"):
-                thumbnail = urljoin(settings.TARGET_BASE_URL, thumbnail)
-            print(f"视频 {video_id} 缩略图: {thumbnail}")
-
-        # 获取标题
-        title = f"Video {index + 1}"
-        # 尝试多种标题选择器
-        title_el = await element.query_selector(".video-title")
-        if not title_el:
-            title_el = await element.query_selector("span.video-title")
-        if not title_el:
-            # 尝试从链接的title属性获取
-            title = await link_el.get_attribute("title")
-        if title_el:
-            title = await title_el.inner_text()
-
-        if not title:
-            title = f"Video {index + 1}"
-
-        # 获取时长
-        duration = None
-        duration_el = await element.query_selector(".duration")
-        if duration_el:
-            duration = await duration_el.inner_text()
-
-        return VideoItem(
-            id=video_id,
-            title=title.strip(),
-            thumbnail=thumbnail,
-            url=url,
-            duration=duration
-        )
+            return 1
 
     async def get_video_detail(self, video_url: str) -> Optional[VideoDetail]:
         """获取视频详情和m3u8链接"""
-        page = await self._get_page()
+        match = VIEWKEY_RE.search(video_url)
+        key = f"detail_{match.group(1) if match else video_url}"
+        return await self._fetch_once(key, partial(self._load_video_detail, video_url))
+
+    async def _load_video_detail(self, video_url: str) -> Optional[VideoDetail]:
+        """打开页面抓取视频详情"""
+        async with self._acquire_page() as page:
+            return await self._scrape_video_detail(page, video_url)
+
+    def _on_fetch_done(self, key: str, task: asyncio.Task):
+        """抓取结束后移出进行中列表"""
+        self._inflight.pop(key, None)
+        # 取出异常，避免所有等待方都已断开时出现 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch_once(self, key: str, fetch):
+        """合并同一页面的并发抓取，只有第一个请求真正打开页面"""
+        # 查找与登记之间没有 await，单线程事件循环下无需加锁
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fetch())
+            task.add_done_callback(partial(self._on_fetch_done, key))
+            self._inflight[key] = task
+        # shield: 单个调用方被取消不会中断其他等待方共享的抓取
+        return await asyncio.shield(task)
+
+    async def _scrape_video_detail(self, page: Page, video_url: str) -> Optional[VideoDetail]:
+        """在给定页面中抓取视频详情"""
         detail = None
 
-        self._pending_requests += 1  # 增加请求计数
-
         try:
-            # 设置请求拦截来捕获m3u8请求
+            # 设置请求拦截来捕获m3u8请求（页面随请求关闭，监听器不会累积）
             m3u8_urls = []
 
-            async def handle_request(request):
-                url = request.url
-                if ".m3u8" in url or "m3u8" in url:
-                    m3u8_urls.append(url)
+            def handle_request(request):
+                if "m3u8" in request.url:
+                    m3u8_urls.append(request.url)
 
             page.on("request", handle_request)
 
@@ -495,36 +575,37 @@ class ScraperService:
                 await page.goto(video_url, wait_until="domcontentloaded", timeout=30000)
             except Exception as goto_error:
                 print(f"页面导航异常 (可能正常): {goto_error}")
-                # 等待页面稳定
-                await asyncio.sleep(2)
 
-            # 等待视频加载
-            await asyncio.sleep(3)
+            # 等待视频元素出现（source 不可见，只要求挂载到 DOM）
+            try:
+                await page.wait_for_selector(DETAIL_VIDEO_SELECTOR, state="attached", timeout=6000)
+            except PlaywrightTimeoutError:
+                pass
 
             # 尝试点击播放按钮（如果有的话）
             try:
                 play_btn = await page.query_selector(".vjs-big-play-button, .play-button, #player")
                 if play_btn:
                     await play_btn.click()
-                    await asyncio.sleep(2)
             except:
                 pass
 
-            # 尝试多种方式获取视频链接
-            video_src = None
+            # 一次性从页面提取视频链接、标题和封面（避免逐个元素往返浏览器）
+            info = await page.evaluate(DETAIL_EXTRACT_JS)
 
-            # 方法1: 从 .video-container 下的 source 标签获取 (优先)
-            source_el = await page.query_selector(".video-container source")
-            if source_el:
-                video_src = await source_el.get_attribute("src")
-                print(f"从 .video-container source 找到: {video_src}")
+            # 播放器的 video 元素可能先于视频地址出现，没有拿到地址时等待点击后发出的 m3u8 请求
+            if not info["container_src"] and not m3u8_urls:
+                try:
+                    await page.wait_for_event("request", predicate=lambda r: "m3u8" in r.url, timeout=DETAIL_M3U8_WAIT_MS)
+                except PlaywrightTimeoutError:
+                    pass
+                info = await page.evaluate(DETAIL_EXTRACT_JS)
 
-            # 方法2: 从 .video-container 下的 video 标签获取
-            if not video_src:
-                video_el = await page.query_selector(".video-container video")
-                if video_el:
-                    video_src = await video_el.get_attribute("src")
-                    print(f"从 .video-container video 找到: {video_src}")
+            # 尝试多种方式获取视频链接
+            # 方法1/2: 从 .video-container 下的 source / video 标签获取 (优先)
+            video_src = info["container_src"]
+            if video_src:
+                print(f"从 .video-container 找到: {video_src}")
 
             # 方法3: 从拦截的请求中获取 m3u8
             if not video_src and m3u8_urls:
@@ -536,60 +617,31 @@ class ScraperService:
                     video_src = m3u8_urls[0]
                 print(f"从请求拦截找到: {video_src}")
 
-            # 方法4: 从页面内容中提取 mp4 或 m3u8 链接
+            # 方法4: 从页面内容中提取 mp4 或 m3u8 链接（在浏览器内匹配，只传回结果）
             if not video_src:
-                content = await page.content()
-                # 先尝试 mp4
-                mp4_pattern = r'https?://[^\s"\'<>]+\.mp4[^\s"\'<>]*'
-                matches = re.findall(mp4_pattern, content)
-                if matches:
-                    video_src = matches[0]
-                    print(f"从页面内容找到mp4: {video_src}")
-                else:
-                    # 再尝试 m3u8
-                    m3u8_pattern = r'https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*'
-                    matches = re.findall(m3u8_pattern, content)
-                    if matches:
-                        video_src = matches[0]
-                        print(f"从页面内容找到m3u8: {video_src}")
-
-            # 方法5: 从任意 video source 标签获取
-            if not video_src:
-                source_el = await page.query_selector("video source")
-                if source_el:
-                    video_src = await source_el.get_attribute("src")
-                    print(f"从 video source 找到: {video_src}")
+                video_src = await page.evaluate(CONTENT_URL_JS)
+                if video_src:
+                    print(f"从页面内容找到: {video_src}")
 
-            # 方法6: 从任意 video 标签的 src 获取
+            # 方法5/6: 从任意 video source / video 标签获取
             if not video_src:
-                video_el = await page.query_selector("video")
-                if video_el:
-                    video_src = await video_el.get_attribute("src")
-                    print(f"从 video src 找到: {video_src}")
+                video_src = info["any_src"]
+                if video_src:
+                    print(f"从 video 标签找到: {video_src}")
 
             print(f"最终视频链接: {video_src}")
 
             # 修复链接格式问题 (如 .com//mp43/ -> .com/mp43/)
             if video_src:
-                video_src = re.sub(r'\.com//+', '.com/', video_src)
+                video_src = DOUBLE_SLASH_RE.sub('.com/', video_src)
                 print(f"修复后链接: {video_src}")
 
-            # 获取标题
-            title = await page.title()
-            title_el = await page.query_selector("h4, .video-title, #viewvideo-title")
-            if title_el:
-                title = await title_el.inner_text()
-
-            # 获取缩略图
-            thumbnail = None
-            video_el = await page.query_selector("video")
-            if video_el:
-                thumbnail = await video_el.get_attribute("poster")
+            title = info["title"]
+            thumbnail = info["poster"]
 
             # 提取视频ID
-            parsed = urlparse(video_url)
-            query_params = parse_qs(parsed.query)
-            video_id = query_params.get("viewkey", ["unknown"])[0]
+            match = VIEWKEY_RE.search(video_url)
+            video_id = match.group(1) if match else "unknown"
 
             detail = VideoDetail(
                 id=video_id,
@@ -599,167 +651,12 @@ class ScraperService:
                 original_url=video_url
             )
 
-            # 获取完视频链接后延迟返回列表页，避免视频继续播放浪费资源
-            # 延迟一段时间确保前端已开始加载视频
-            scraper = self  # 保存引用
-
-            async def delayed_go_back():
-                await asyncio.sleep(10)  # 等待10秒让前端有时间加载
-                # 检查是否还有其他请求正在进行
-                if scraper._pending_requests > 0:
-                    print(f"有 {scraper._pending_requests} 个请求正在进行，暂不返回列表页")
-                    return
-                try:
-                    print("返回列表页...")
-                    await page.go_back(wait_until="domcontentloaded", timeout=10000)
-                except Exception as back_error:
-                    print(f"返回列表页失败: {back_error}")
-                    try:
-                        list_url = urljoin(settings.TARGET_BASE_URL, settings.VIDEO_LIST_PATH)
-                        await page.goto(list_url, wait_until="domcontentloaded", timeout=10000)
-                    except:
-                        pass
-
-            # 异步执行，不阻塞返回
-            asyncio.create_task(delayed_go_back())
-
         except Exception as e:
             print(f"获取视频详情失败: {e}")
-            import traceback
             traceback.print_exc()
-        finally:
-            self._pending_requests -= 1  # 减少请求计数
 
         return detail
 
-    async def get_video_detail_in_new_tab(self, video_url: str) -> Optional[VideoDetail]:
-        """在新标签页获取视频详情（用于后台预缓存，不干扰主页面）"""
-        if not self._context:
-            await self.initialize()
-
-        page = None
-        try:
-            page = await self._context.new_page()
-            print(f"[预缓存] 新标签页访问: {video_url}")
-
-            # 设置请求拦截来捕获m3u8请求
-            m3u8_urls = []
-
-            async def handle_request(request):
-                url = request.url
-                if ".m3u8" in url or "m3u8" in url:
-                    m3u8_urls.append(url)
-
-            page.on("request", handle_request)
-
-            try:
-                await page.goto(video_url, wait_until="domcontentloaded", timeout=30000)
-            except Exception as goto_error:
-                print(f"[预缓存] 页面导航异常: {goto_error}")
-                await asyncio.sleep(2)
-
-            await asyncio.sleep(3)
-
-            # 尝试点击播放按钮
-            try:
-                play_btn = await page.query_selector(".vjs-big-play-button, .play-button, #player")
-                if play_btn:
-                    await play_btn.click()
-                    await asyncio.sleep(2)
-            except:
-                pass
-
-            # 获取视频链接
-            video_src = None
-
-            # 方法1: 从 .video-container 下的 source 标签获取
-            source_el = await page.query_selector(".video-container source")
-            if source_el:
-                video_src = await source_el.get_attribute("src")
-
-            # 方法2: 从 .video-container 下的 video 标签获取
-            if not video_src:
-                video_el = await page.query_selector(".video-container video")
-                if video_el:
-                    video_src = await video_el.get_attribute("src")
-
-            # 方法3: 从拦截的请求中获取 m3u8
-            if not video_src and m3u8_urls:
-                for url in m3u8_urls:
-                    if "index.m3u8" in url or "/hls/" in url:
-                        video_src = url
-                        break
-                if not video_src:
-                    video_src = m3u8_urls[0]
-
-            # 方法4: 从页面内容中提取
-            if not video_src:
-                content = await page.content()
-                mp4_pattern = r'https?://[^\s"\'<>]+\.mp4[^\s"\'<>]*'
-                matches = re.findall(mp4_pattern, content)
-                if matches:
-                    video_src = matches[0]
-                else:
-                    m3u8_pattern = r'https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*'
-                    matches = re.findall(m3u8_pattern, content)
-                    if matches:
-                        video_src = matches[0]
-
-            # 方法5: 从任意 video source 标签获取
-            if not video_src:
-                source_el = await page.query_selector("video source")
-                if source_el:
-                    video_src = await source_el.get_attribute("src")
-
-            # 方法6: 从任意 video 标签的 src 获取
-            if not video_src:
-                video_el = await page.query_selector("video")
-                if video_el:
-                    video_src = await video_el.get_attribute("src")
-
-            if video_src:
-                video_src = re.sub(r'\.com//+', '.com/', video_src)
-
-            # 获取标题
-            title = await page.title()
-            title_el = await page.query_selector("h4, .video-title, #viewvideo-title")
-            if title_el:
-                title = await title_el.inner_text()
-
-            # 获取缩略图
-            thumbnail = None
-            video_el = await page.query_selector("video")
-            if video_el:
-                thumbnail = await video_el.get_attribute("poster")
-
-            # 提取视频ID
-            parsed = urlparse(video_url)
-            query_params = parse_qs(parsed.query)
-            video_id = query_params.get("viewkey", ["unknown"])[0]
-
-            if video_src:
-                print(f"[预缓存] 获取到视频链接: {video_id}")
-                return VideoDetail(
-                    id=video_id,
-                    title=title.strip() if title else "未知标题",
-                    thumbnail=thumbnail,
-                    m3u8_url=video_src,
-                    original_url=video_url
-                )
-            else:
-                print(f"[预缓存] 未找到视频链接: {video_id}")
-                return None
-
-        except Exception as e:
-            print(f"[预缓存] 获取视频详情失败: {e}")
-            return None
-        finally:
-            if page:
-                try:
-                    await page.close()
-                except:
-                    pass
-
 
 # 全局单例
 scraper_service = ScraperService()
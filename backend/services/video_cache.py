@@ -2,12 +2,132 @@ import os
 import asyncio
 import aiohttp
 import aiofiles
-import json
+import logging
+import orjson
 import re
+import shutil
+import time
+from email.utils import formatdate
+from functools import partial
+from hashlib import blake2b
 from urllib.parse import urljoin, urlparse
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 from pathlib import Path
+from cachetools import LRUCache
 from ..config import settings
+from .cache_index import cache_index
+from ..models.video import VideoDetail
+
+logger = logging.getLogger(__name__)
+
+# 缓存统计结果的有效期（秒）
+_STAT_CACHE_TTL = 5
+
+# m3u8 标签中的 URI 属性
+_URI_RE = re.compile(r'URI="([^"]+)"')
+
+# 详情/列表解析结果的内存缓存容量
+_MEMCACHE_MAX = 1024
+
+# MP4 边下载边写盘的块大小
+_MP4_CHUNK_SIZE = 1024 * 1024
+
+# 封面图缓存超过该时间（秒）后，下次获取列表时向源站条件请求确认是否更新
+_THUMBNAIL_REVALIDATE_AGE = 7 * 24 * 60 * 60
+
+# 分片边下载边写盘的块大小
+_SEGMENT_CHUNK_SIZE = 256 * 1024
+
+# 分片下载进度日志的最小间隔（秒），避免并发下载时逐个分片刷屏
+_PROGRESS_LOG_INTERVAL = 1.0
+
+# 等待下载进度时，被唤醒后再等待该时间（秒）合并随后的多次更新
+_PROGRESS_COALESCE_DELAY = 0.25
+
+# 分片被限流（HTTP 429）时的最大重试次数，间隔按 1, 2, 4, 8, 16 秒退避（有 Retry-After 时按其等待）
+_SEGMENT_MAX_RETRIES = 5
+
+
+def _dir_size(path: str) -> int:
+    """递归计算目录下所有文件的大小"""
+    total = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                total += _dir_size(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+def _read_segment_etag(segment_path: Path) -> Optional[str]:
+    """读取分片下载时保存的ETag，旧缓存没有时按修改时间和大小生成（只读，同步，需在线程中调用）"""
+    try:
+        return segment_path.with_name(segment_path.name + ".etag").read_text()
+    except FileNotFoundError:
+        pass
+
+    try:
+        st = segment_path.stat()
+    except FileNotFoundError:
+        return None
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _read_or_none(path: Path) -> Optional[bytes]:
+    """读取文件，不存在返回 None（同步，需在线程中调用）"""
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _read_legacy_sync(path: Path) -> Optional[Tuple[float, bytes]]:
+    """读取旧版本保存的缓存文件，返回 (修改时间, 内容)，不存在返回 None（同步，需在线程中调用）"""
+    try:
+        return path.stat().st_mtime, path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _save_thumbnail_sync(thumb_path: Path, content: bytes, etag: Optional[str]):
+    """写入封面图，有ETag时一并保存供下次条件请求（同步，需在线程中调用）"""
+    thumb_path.write_bytes(content)
+    etag_path = thumb_path.with_name(thumb_path.name + ".etag")
+    if etag:
+        etag_path.write_text(etag)
+    else:
+        etag_path.unlink(missing_ok=True)
+
+
+def _finish_segment_sync(tmp_path: Path, segment_path: Path, etag: str):
+    """下载完成的临时分片改为正式文件，并保存其ETag（同步，需在线程中调用）"""
+    os.replace(tmp_path, segment_path)
+    # 分片写入后不再变化，保存ETag供客户端条件请求
+    segment_path.with_name(segment_path.name + ".etag").write_text(etag)
+
+
+def _finalize_sync(cache_dir: Path, m3u8_text: str):
+    """原子写入本地m3u8后再创建完成标记，中途崩溃不会留下看似完整的缓存（同步，需在线程中调用）"""
+    m3u8_path = cache_dir / "video.m3u8"
+    tmp_path = cache_dir / "video.m3u8.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(m3u8_text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, m3u8_path)
+
+    with open(cache_dir / ".complete", "w") as f:
+        f.write("complete")
+        f.flush()
+        os.fsync(f.fileno())
+
+    # 同步目录项，确保重命名和完成标记落盘
+    dir_fd = os.open(cache_dir, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
 
 
 class VideoCacheService:
@@ -16,20 +136,41 @@ class VideoCacheService:
     def __init__(self):
         self._download_tasks: Dict[str, asyncio.Task] = {}
         self._download_progress: Dict[str, dict] = {}
+        self._progress_log_ts: Dict[str, float] = {}  # 各视频上次输出下载进度日志的时间
+        self._progress_events: Dict[str, asyncio.Event] = {}  # 有等待方的视频 -> 进度更新事件
         self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
+        self._host_sems: Dict[str, asyncio.Semaphore] = {}  # 源站 -> 并发限制（所有视频共享）
         self._cache_dir = Path(settings.VIDEO_CACHE_DIR)
+        self._cache_prefix = os.path.join(settings.VIDEO_CACHE_DIR, "")  # 带结尾分隔符，热路径直接拼接字符串路径
+        self._stat_cache: Optional[Tuple[float, List[dict], int]] = None  # (时间, 视频列表, 总大小)
+        # 详情/列表解析结果，写入和删除时同步更新: viewkey -> 详情 / 页码 -> (保存时间, 数据)
+        self._detail_memcache = LRUCache(maxsize=_MEMCACHE_MAX)
+        self._list_memcache = LRUCache(maxsize=_MEMCACHE_MAX)
+        self._cached_keys: set = set()  # 已确认完整缓存的视频，下载完成时加入，删除时移除
 
     async def _get_session(self) -> aiohttp.ClientSession:
         """获取HTTP会话"""
         if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession(
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                    "Accept": "*/*",
-                    "Referer": settings.TARGET_BASE_URL,
-                },
-                timeout=aiohttp.ClientTimeout(total=300, connect=10),
-            )
+            async with self._session_lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=64,  # 最大连接数（多个视频同时缓存 + 封面图）
+                        limit_per_host=32,  # 每个主机最大连接数
+                        ttl_dns_cache=300,  # DNS缓存时间
+                        use_dns_cache=True,
+                        keepalive_timeout=75,  # 长连接保持，同一视频的分片复用连接，减少重复握手
+                        enable_cleanup_closed=True,
+                    )
+                    self._session = aiohttp.ClientSession(
+                        connector=connector,
+                        headers={
+                            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+                            "Accept": "*/*",
+                            "Referer": settings.TARGET_BASE_URL,
+                        },
+                        timeout=aiohttp.ClientTimeout(total=300, connect=10),
+                    )
         return self._session
 
     def _get_video_cache_dir(self, viewkey: str) -> Path:
@@ -48,6 +189,14 @@ class VideoCacheService:
         """获取列表缓存路径"""
         return self._cache_dir / f"list_page_{page}.json"
 
+    def _mp4_path_str(self, viewkey: str) -> str:
+        """获取MP4缓存路径（字符串，免去构造 Path 对象）"""
+        return f"{self._cache_prefix}{viewkey}.mp4"
+
+    def _thumbnail_path_str(self, viewkey: str) -> str:
+        """获取封面图缓存路径（字符串）"""
+        return f"{self._cache_prefix}{viewkey}.jpg"
+
     def _ensure_cache_dir(self, viewkey: str) -> Path:
         """确保缓存目录存在"""
         cache_dir = self._get_video_cache_dir(viewkey)
@@ -56,17 +205,23 @@ class VideoCacheService:
 
     def is_cached(self, viewkey: str) -> bool:
         """检查视频是否已完整缓存"""
-        # 检查MP4
-        mp4_path = self._get_mp4_cache_path(viewkey)
-        if mp4_path.exists():
+        if viewkey in self._cached_keys:
             return True
 
-        # 检查M3U8
-        cache_dir = self._get_video_cache_dir(viewkey)
-        m3u8_path = cache_dir / "video.m3u8"
-        complete_marker = cache_dir / ".complete"
+        # 依次检查MP4文件和M3U8完成标记（完成标记总在 video.m3u8 落盘后才创建）
+        for path in (self._mp4_path_str(viewkey), f"{self._cache_prefix}{viewkey}{os.sep}.complete"):
+            try:
+                os.stat(path)
+            except FileNotFoundError:
+                continue
+            self._cached_keys.add(viewkey)
+            return True
+        return False
 
-        return m3u8_path.exists() and complete_marker.exists()
+    async def warm_cache_index(self):
+        """启动时扫描一次缓存目录，预先登记已缓存的视频"""
+        cached, _ = await self.stat_all()
+        logger.info("[Cache] 已缓存视频: %s", len(cached))
 
     def is_downloading(self, viewkey: str) -> bool:
         """检查视频是否正在下载"""
@@ -76,40 +231,56 @@ class VideoCacheService:
         """获取下载进度"""
         return self._download_progress.get(viewkey)
 
-    async def get_cached_m3u8(self, viewkey: str) -> Optional[str]:
-        """获取缓存的m3u8内容（重写为本地分片路径）"""
-        cache_dir = self._get_video_cache_dir(viewkey)
-        m3u8_path = cache_dir / "video.m3u8"
-
-        if not m3u8_path.exists():
-            return None
+    def _notify_progress(self, viewkey: str):
+        """通知等待方进度已更新（没有等待方时只是一次字典查找）"""
+        event = self._progress_events.pop(viewkey, None)
+        if event:
+            event.set()
+
+    async def wait_progress(self, viewkey: str, timeout: float) -> Optional[dict]:
+        """等待下载进度更新后返回最新进度，未在下载或超时则直接返回当前进度"""
+        if self.is_downloading(viewkey):
+            event = self._progress_events.get(viewkey)
+            if event is None:
+                event = self._progress_events[viewkey] = asyncio.Event()
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+                # 并发下载时进度更新很密集，稍等片刻合并为一次返回
+                await asyncio.sleep(_PROGRESS_COALESCE_DELAY)
+            except TimeoutError:
+                pass
+            if not self.is_downloading(viewkey):
+                self._progress_events.pop(viewkey, None)
+        return self._download_progress.get(viewkey)
 
-        async with aiofiles.open(m3u8_path, "r") as f:
-            return await f.read()
+    async def get_cached_m3u8(self, viewkey: str) -> Optional[bytes]:
+        """获取缓存的m3u8原始内容（分片为本地文件名）"""
+        m3u8_path = self._get_video_cache_dir(viewkey) / "video.m3u8"
+        return await asyncio.to_thread(_read_or_none, m3u8_path)
 
     async def get_cached_segment(self, viewkey: str, segment_name: str) -> Optional[bytes]:
         """获取缓存的分片"""
-        cache_dir = self._get_video_cache_dir(viewkey)
-        segment_path = cache_dir / segment_name
-
-        if not segment_path.exists():
-            return None
+        segment_path = self._get_video_cache_dir(viewkey) / segment_name
+        return await asyncio.to_thread(_read_or_none, segment_path)
 
-        async with aiofiles.open(segment_path, "rb") as f:
-            return await f.read()
+    async def get_segment_etag(self, viewkey: str, segment_name: str) -> Optional[str]:
+        """获取缓存分片的ETag，分片不存在返回 None"""
+        segment_path = self._get_video_cache_dir(viewkey) / segment_name
+        return await asyncio.to_thread(_read_segment_etag, segment_path)
 
-    def get_cached_mp4_path(self, viewkey: str) -> Optional[Path]:
-        """获取缓存的MP4路径"""
+    async def open_mp4_sendfile(self, viewkey: str) -> Optional[Tuple[Path, os.stat_result]]:
+        """获取缓存MP4的路径和文件信息（交给 FileResponse 直接发送文件），不存在返回 None"""
         mp4_path = self._get_mp4_cache_path(viewkey)
-        if mp4_path.exists():
-            return mp4_path
-        return None
+        try:
+            return mp4_path, await asyncio.to_thread(os.stat, mp4_path)
+        except FileNotFoundError:
+            return None
 
     def get_cached_thumbnail_path(self, viewkey: str) -> Optional[Path]:
         """获取缓存的封面图路径"""
-        thumb_path = self._get_thumbnail_cache_path(viewkey)
-        if thumb_path.exists():
-            return thumb_path
+        thumb_path = self._thumbnail_path_str(viewkey)
+        if os.path.exists(thumb_path):
+            return Path(thumb_path)
         return None
 
     async def download_thumbnail(self, viewkey: str, thumbnail_url: str) -> bool:
@@ -121,19 +292,36 @@ class VideoCacheService:
             self._cache_dir.mkdir(parents=True, exist_ok=True)
             thumb_path = self._get_thumbnail_cache_path(viewkey)
 
-            if thumb_path.exists():
-                return True
+            # 已缓存且较新时直接使用，较旧时带上修改时间和ETag向源站确认
+            headers = None
+            try:
+                st = os.stat(thumb_path)
+            except FileNotFoundError:
+                st = None
+            if st:
+                if time.time() - st.st_mtime < _THUMBNAIL_REVALIDATE_AGE:
+                    return True
+                headers = {"If-Modified-Since": formatdate(st.st_mtime, usegmt=True)}
+                etag = await asyncio.to_thread(_read_or_none, thumb_path.with_name(thumb_path.name + ".etag"))
+                if etag:
+                    headers["If-None-Match"] = etag.decode()
 
             session = await self._get_session()
-            async with session.get(thumbnail_url) as resp:
+            async with session.get(thumbnail_url, headers=headers) as resp:
+                if resp.status == 304:
+                    # 源站未更新，刷新修改时间，下个周期再确认
+                    await asyncio.to_thread(os.utime, thumb_path)
+                    return True
                 if resp.status == 200:
                     content = await resp.read()
-                    async with aiofiles.open(thumb_path, "wb") as f:
-                        await f.write(content)
-                    print(f"[Cache] 已缓存封面图: {viewkey}")
+                    await asyncio.to_thread(_save_thumbnail_sync, thumb_path, content, resp.headers.get("ETag"))
+                    logger.debug("[Cache] 已缓存封面图: %s", viewkey)
+                    return True
+                # 确认失败时继续使用已有的封面图
+                if st:
                     return True
         except Exception as e:
-            print(f"[Cache] 下载封面图失败 {viewkey}: {e}")
+            logger.warning("[Cache] 下载封面图失败 %s: %s", viewkey, e)
         return False
 
     async def get_cached_list(self, page: int, max_age: int = None) -> Optional[dict]:
@@ -146,143 +334,128 @@ class VideoCacheService:
         Returns:
             缓存数据，如果不存在或已过期返回 None
         """
-        list_path = self._get_list_cache_path(page)
-
-        if not list_path.exists():
-            return None
-
         try:
-            # 检查缓存时间
-            if max_age is not None:
-                import time
-                file_mtime = list_path.stat().st_mtime
-                if time.time() - file_mtime > max_age:
-                    print(f"[Cache] 列表缓存已过期: 第{page}页")
-                    return None
+            cached = self._list_memcache.get(page)
+            if cached is None:
+                row = await asyncio.to_thread(cache_index.get_list, page)
+                if row is None:
+                    # 兼容旧版本保存的列表文件，读到后导入索引
+                    row = await asyncio.to_thread(_read_legacy_sync, self._get_list_cache_path(page))
+                    if row is None:
+                        return None
+                    await asyncio.to_thread(cache_index.put_list, page, row[1], row[0])
+                cached = (row[0], orjson.loads(row[1]))
+                self._list_memcache[page] = cached
+                logger.debug("[Cache] 读取列表缓存: 第%s页", page)
 
-            async with aiofiles.open(list_path, "r", encoding="utf-8") as f:
-                data = json.loads(await f.read())
-                print(f"[Cache] 读取列表缓存: 第{page}页")
-                return data
+            # 检查缓存时间
+            saved_at, data = cached
+            if max_age is not None and time.time() - saved_at > max_age:
+                return None
+            return data
         except Exception as e:
-            print(f"[Cache] 读取列表缓存失败 page={page}: {e}")
+            logger.warning("[Cache] 读取列表缓存失败 page=%s: %s", page, e)
             return None
 
     async def save_list_cache(self, page: int, data: dict):
         """保存视频列表到缓存"""
         try:
-            self._cache_dir.mkdir(parents=True, exist_ok=True)
-            list_path = self._get_list_cache_path(page)
-
-            async with aiofiles.open(list_path, "w", encoding="utf-8") as f:
-                await f.write(json.dumps(data, ensure_ascii=False, indent=2))
-            print(f"[Cache] 已保存列表缓存: 第{page}页")
+            saved_at = time.time()
+            self._list_memcache.pop(page, None)
+            await asyncio.to_thread(cache_index.put_list, page, orjson.dumps(data), saved_at)
+            self._list_memcache[page] = (saved_at, data)
+            logger.debug("[Cache] 已保存列表缓存: 第%s页", page)
         except Exception as e:
-            print(f"[Cache] 保存列表缓存失败 page={page}: {e}")
-
-    def _get_detail_path(self, viewkey: str) -> Path:
-        """获取详情缓存文件路径"""
-        # M3U8格式存在目录下，MP4格式存在同级目录
-        cache_dir = self._get_video_cache_dir(viewkey)
-        if cache_dir.exists():
-            return cache_dir / "detail.json"
-        # MP4格式的详情文件
-        return self._cache_dir / f"{viewkey}.detail.json"
+            logger.warning("[Cache] 保存列表缓存失败 page=%s: %s", page, e)
+
+    def _read_legacy_detail_sync(self, viewkey: str) -> Optional[bytes]:
+        """读取旧版本保存的详情文件，依次检查M3U8格式和MP4格式（同步，需在线程中调用）"""
+        for detail_path in (self._get_video_cache_dir(viewkey) / "detail.json",
+                            self._cache_dir / f"{viewkey}.detail.json"):
+            content = _read_or_none(detail_path)
+            if content is not None:
+                return content
+        return None
 
     async def get_cached_detail(self, viewkey: str) -> Optional[Any]:
         """获取缓存的视频详情"""
-        from ..models.video import VideoDetail
-
-        # 检查M3U8格式的详情
-        cache_dir = self._get_video_cache_dir(viewkey)
-        detail_path = cache_dir / "detail.json"
-
-        if not detail_path.exists():
-            # 检查MP4格式的详情
-            detail_path = self._cache_dir / f"{viewkey}.detail.json"
-
-        if not detail_path.exists():
-            return None
+        cached = self._detail_memcache.get(viewkey)
+        if cached:
+            return cached
 
         try:
-            async with aiofiles.open(detail_path, "r", encoding="utf-8") as f:
-                data = json.loads(await f.read())
-                return VideoDetail(**data)
+            content = await asyncio.to_thread(cache_index.get_detail, viewkey)
+            if content is None:
+                # 兼容旧版本保存的详情文件，读到后导入索引
+                content = await asyncio.to_thread(self._read_legacy_detail_sync, viewkey)
+                if content is None:
+                    return None
+                await asyncio.to_thread(cache_index.put_detail, viewkey, content)
+
+            detail = VideoDetail.model_validate_json(content)
+            self._detail_memcache[viewkey] = detail
+            return detail
         except Exception as e:
-            print(f"[Cache] 读取详情失败 {viewkey}: {e}")
+            logger.warning("[Cache] 读取详情失败 %s: %s", viewkey, e)
             return None
 
     async def save_detail(self, viewkey: str, detail: Any):
         """保存视频详情到缓存"""
-        # 确定保存路径
-        cache_dir = self._get_video_cache_dir(viewkey)
-        if cache_dir.exists():
-            detail_path = cache_dir / "detail.json"
-        else:
-            self._cache_dir.mkdir(parents=True, exist_ok=True)
-            detail_path = self._cache_dir / f"{viewkey}.detail.json"
-
         try:
-            # 转换为字典
-            if hasattr(detail, "model_dump"):
-                data = detail.model_dump()
-            elif hasattr(detail, "dict"):
-                data = detail.dict()
+            # pydantic 模型直接序列化为JSON，其他对象先转换为字典
+            if hasattr(detail, "model_dump_json"):
+                payload = detail.model_dump_json().encode()
             else:
-                data = dict(detail)
+                data = detail.dict() if hasattr(detail, "dict") else dict(detail)
+                payload = orjson.dumps(data)
 
-            async with aiofiles.open(detail_path, "w", encoding="utf-8") as f:
-                await f.write(json.dumps(data, ensure_ascii=False, indent=2))
-            print(f"[Cache] 已保存详情: {viewkey}")
+            self._detail_memcache.pop(viewkey, None)
+            await asyncio.to_thread(cache_index.put_detail, viewkey, payload)
+            logger.debug("[Cache] 已保存详情: %s", viewkey)
         except Exception as e:
-            print(f"[Cache] 保存详情失败 {viewkey}: {e}")
-
-    async def start_cache_download(self, viewkey: str, m3u8_url: str, m3u8_content: str, detail: Any = None):
-        """启动后台下载任务（M3U8格式）"""
-        if not settings.VIDEO_CACHE_ENABLED:
-            return
+            logger.warning("[Cache] 保存详情失败 %s: %s", viewkey, e)
 
-        if self.is_cached(viewkey) or self.is_downloading(viewkey):
-            return
+    async def start_cache_download(self, viewkey: str, m3u8_url: str, m3u8_content: str,
+                                   detail: Any = None) -> Optional[asyncio.Task]:
+        """启动后台下载任务（M3U8格式），返回下载任务（已在下载则返回进行中的任务），未启用或已缓存返回 None"""
+        return self._start_download(viewkey, partial(self._download_m3u8_video, viewkey, m3u8_url, m3u8_content, detail))
 
-        task = asyncio.create_task(self._download_m3u8_video(viewkey, m3u8_url, m3u8_content, detail))
-        self._download_tasks[viewkey] = task
+    async def start_mp4_cache_download(self, viewkey: str, mp4_url: str, detail: Any = None) -> Optional[asyncio.Task]:
+        """启动后台下载任务（MP4格式），返回值同 start_cache_download"""
+        return self._start_download(viewkey, partial(self._download_mp4_video, viewkey, mp4_url, detail))
 
-    async def start_mp4_cache_download(self, viewkey: str, mp4_url: str, detail: Any = None):
-        """启动后台下载任务（MP4格式）"""
+    def _start_download(self, viewkey: str, download) -> Optional[asyncio.Task]:
+        """同一视频只启动一个下载任务，重复调用返回进行中的任务"""
         if not settings.VIDEO_CACHE_ENABLED:
-            return
+            return None
 
-        if self.is_cached(viewkey) or self.is_downloading(viewkey):
-            return
+        # 查找与登记之间没有 await，单线程事件循环下不会并发启动两次
+        task = self._download_tasks.get(viewkey)
+        if task and not task.done():
+            return task
+        if self.is_cached(viewkey):
+            return None
 
-        task = asyncio.create_task(self._download_mp4_video(viewkey, mp4_url, detail))
+        task = asyncio.create_task(download())
         self._download_tasks[viewkey] = task
+        return task
 
     async def _download_m3u8_video(self, viewkey: str, m3u8_url: str, m3u8_content: str, detail: Any = None):
         """下载M3U8视频的所有分片"""
         try:
-            print(f"[Cache] 开始下载视频: {viewkey}")
+            logger.info("[Cache] 开始下载视频: %s", viewkey)
             cache_dir = self._ensure_cache_dir(viewkey)
 
             # 同时下载封面图
             if detail and hasattr(detail, 'thumbnail') and detail.thumbnail:
                 await self.download_thumbnail(viewkey, detail.thumbnail)
 
-            # 解析m3u8获取分片URL列表
-            segments = self._parse_m3u8_segments(m3u8_content, m3u8_url)
-
-            self._download_progress[viewkey] = {
-                "total": len(segments),
-                "downloaded": 0,
-                "status": "downloading",
-            }
-
-            session = await self._get_session()
+            # 一次遍历m3u8：生成本地m3u8内容，同时规划分片下载
+            base = self._get_base_url(m3u8_url)
             local_m3u8_lines = []
-            segment_index = 0
+            planned = []  # (分片URL, 本地路径)
 
-            for line in m3u8_content.split("\n"):
+            for line in m3u8_content.splitlines():
                 line = line.strip()
                 if not line:
                     local_m3u8_lines.append(line)
@@ -291,63 +464,118 @@ class VideoCacheService:
                 if line.startswith("#"):
                     # 处理带有URI的标签
                     if "URI=" in line:
-                        line = self._rewrite_uri_for_local(line, viewkey, segment_index)
+                        line = self._rewrite_uri_for_local(line, viewkey, len(planned))
                     local_m3u8_lines.append(line)
                     continue
 
-                # 这是一个分片URL
-                segment_url = segments[segment_index]["url"]
-                segment_name = f"{segment_index}.ts"
-
-                # 下载分片
-                try:
-                    async with session.get(segment_url) as resp:
-                        if resp.status == 200:
-                            content = await resp.read()
-                            segment_path = cache_dir / segment_name
-                            async with aiofiles.open(segment_path, "wb") as f:
-                                await f.write(content)
-                            print(f"[Cache] {viewkey}: 已下载分片 {segment_index + 1}/{len(segments)}")
-                except Exception as e:
-                    print(f"[Cache] 分片下载失败 {segment_url}: {e}")
-
-                # 写入本地分片名称
+                # 这是一个分片URL，转换为绝对URL并写入本地分片名称
+                segment_url = line if line.startswith("http") else urljoin(base, line)
+                segment_name = f"{len(planned)}.ts"
+                planned.append((segment_url, cache_dir / segment_name))
                 local_m3u8_lines.append(segment_name)
-                segment_index += 1
 
-                self._download_progress[viewkey]["downloaded"] = segment_index
+            self._download_progress[viewkey] = {
+                "total": len(planned),
+                "downloaded": 0,
+                "downloaded_bytes": 0,
+                "failed": 0,
+                "status": "downloading",
+            }
+
+            # 并发下载分片（下载耗时主要在网络往返，受信号量限制并发数）
+            session = await self._get_session()
+            semaphore = asyncio.Semaphore(settings.SEGMENT_CONCURRENCY)
+            async with asyncio.TaskGroup() as tg:
+                for segment_url, segment_path in planned:
+                    tg.create_task(self._download_segment(viewkey, session, semaphore, segment_url, segment_path))
 
-            # 保存本地m3u8
-            m3u8_path = cache_dir / "video.m3u8"
-            async with aiofiles.open(m3u8_path, "w") as f:
-                await f.write("\n".join(local_m3u8_lines))
+            # 有分片缺失时不创建完成标记，避免把不完整的视频当作已缓存
+            failed = self._download_progress[viewkey]["failed"]
+            if failed:
+                raise Exception(f"{failed}/{len(planned)} 个分片下载失败")
 
-            # 创建完成标记
-            complete_marker = cache_dir / ".complete"
-            async with aiofiles.open(complete_marker, "w") as f:
-                await f.write("complete")
+            # 保存本地m3u8并创建完成标记
+            await asyncio.to_thread(_finalize_sync, cache_dir, "\n".join(local_m3u8_lines))
 
             # 保存视频详情
             if detail:
                 await self.save_detail(viewkey, detail)
 
             self._download_progress[viewkey]["status"] = "complete"
-            print(f"[Cache] 视频下载完成: {viewkey}")
+            self._cached_keys.add(viewkey)
+            self._invalidate_stat_cache()
+            logger.info("[Cache] 视频下载完成: %s", viewkey)
 
         except Exception as e:
-            print(f"[Cache] 视频下载失败 {viewkey}: {e}")
+            logger.warning("[Cache] 视频下载失败 %s: %s", viewkey, e)
             self._download_progress[viewkey] = {
                 "status": "error",
                 "error": str(e),
             }
         finally:
+            self._progress_log_ts.pop(viewkey, None)
             if viewkey in self._download_tasks:
                 del self._download_tasks[viewkey]
+            self._notify_progress(viewkey)
+
+    def _host_sem(self, url: str) -> asyncio.Semaphore:
+        """获取源站的并发限制，避免多个视频同时缓存时触发源站限流"""
+        host = urlparse(url).netloc
+        sem = self._host_sems.get(host)
+        if sem is None:
+            sem = self._host_sems[host] = asyncio.Semaphore(settings.PER_HOST_CONCURRENCY)
+        return sem
+
+    async def _download_segment(self, viewkey: str, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                                segment_url: str, segment_path: Path):
+        """下载单个分片，失败记录日志并计入失败数（不影响其他分片）"""
+        progress = self._download_progress[viewkey]
+        tmp_path = segment_path.with_name(segment_path.name + ".tmp")
+        host_sem = self._host_sem(segment_url)
+        ok = False
+        async with semaphore:
+            try:
+                for attempt in range(_SEGMENT_MAX_RETRIES + 1):
+                    delay = None
+                    async with host_sem, session.get(segment_url) as resp:
+                        if resp.status == 429 and attempt < _SEGMENT_MAX_RETRIES:
+                            retry_after = resp.headers.get("Retry-After", "")
+                            delay = int(retry_after) if retry_after.isdigit() else 2 ** attempt
+                        elif resp.status == 200:
+                            # 边下载边写入临时文件并计算ETag，内存占用与分片大小无关
+                            hasher = blake2b(digest_size=8)
+                            async with aiofiles.open(tmp_path, "wb") as f:
+                                async for chunk in resp.content.iter_chunked(_SEGMENT_CHUNK_SIZE):
+                                    hasher.update(chunk)
+                                    await f.write(chunk)
+                                    progress["downloaded_bytes"] += len(chunk)
+                            await asyncio.to_thread(_finish_segment_sync, tmp_path, segment_path, f'"{hasher.hexdigest()}"')
+                            ok = True
+                        else:
+                            logger.warning("[Cache] 分片下载失败 %s: HTTP %s", segment_url, resp.status)
+                    if delay is None:
+                        break
+                    # 等待期间不占用源站并发名额
+                    logger.warning("[Cache] 分片请求被限流，%s秒后重试: %s", delay, segment_url)
+                    await asyncio.sleep(delay)
+            except Exception as e:
+                logger.warning("[Cache] 分片下载失败 %s: %s", segment_url, e)
+                tmp_path.unlink(missing_ok=True)
+            if not ok:
+                progress["failed"] += 1
+            progress["downloaded"] += 1
+            self._notify_progress(viewkey)
+
+        # 进度日志限频输出，最后一个分片总会输出
+        now = time.monotonic()
+        if progress["downloaded"] == progress["total"] or now - self._progress_log_ts.get(viewkey, 0) >= _PROGRESS_LOG_INTERVAL:
+            self._progress_log_ts[viewkey] = now
+            logger.info("[Cache] %s: 已下载分片 %d/%d", viewkey, progress["downloaded"], progress["total"])
 
     async def _download_mp4_video(self, viewkey: str, mp4_url: str, detail: Any = None):
         """下载MP4视频"""
         try:
-            print(f"[Cache] 开始下载MP4: {viewkey}")
+            logger.info("[Cache] 开始下载MP4: %s", viewkey)
             self._cache_dir.mkdir(parents=True, exist_ok=True)
 
             # 同时下载封面图
@@ -373,11 +601,23 @@ class VideoCacheService:
                 self._download_progress[viewkey]["total"] = total_size
 
                 async with aiofiles.open(temp_path, "wb") as f:
+                    # 已知大小时预先分配磁盘空间，减少碎片和写入时的元数据更新
+                    if total_size and hasattr(os, "posix_fallocate"):
+                        try:
+                            await asyncio.to_thread(os.posix_fallocate, f.fileno(), 0, total_size)
+                        except OSError:
+                            pass
+
                     downloaded = 0
-                    async for chunk in resp.content.iter_chunked(512 * 1024):
+                    async for chunk in resp.content.iter_chunked(_MP4_CHUNK_SIZE):
                         await f.write(chunk)
                         downloaded += len(chunk)
                         self._download_progress[viewkey]["downloaded"] = downloaded
+                        self._notify_progress(viewkey)
+
+                    # 实际长度与 Content-Length 不符时截掉预分配的多余部分
+                    if downloaded != total_size:
+                        await f.truncate(downloaded)
 
             # 重命名为最终文件
             temp_path.rename(mp4_path)
@@ -387,10 +627,12 @@ class VideoCacheService:
                 await self.save_detail(viewkey, detail)
 
             self._download_progress[viewkey]["status"] = "complete"
-            print(f"[Cache] MP4下载完成: {viewkey}")
+            self._cached_keys.add(viewkey)
+            self._invalidate_stat_cache()
+            logger.info("[Cache] MP4下载完成: %s", viewkey)
 
         except Exception as e:
-            print(f"[Cache] MP4下载失败 {viewkey}: {e}")
+            logger.warning("[Cache] MP4下载失败 %s: %s", viewkey, e)
             self._download_progress[viewkey] = {
                 "status": "error",
                 "error": str(e),
@@ -402,26 +644,7 @@ class VideoCacheService:
         finally:
             if viewkey in self._download_tasks:
                 del self._download_tasks[viewkey]
-
-    def _parse_m3u8_segments(self, content: str, base_url: str) -> List[dict]:
-        """解析m3u8文件获取分片URL列表"""
-        segments = []
-        base = self._get_base_url(base_url)
-
-        for line in content.split("\n"):
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-
-            # 转换为绝对URL
-            if not line.startswith("http"):
-                segment_url = urljoin(base, line)
-            else:
-                segment_url = line
-
-            segments.append({"url": segment_url})
-
-        return segments
+            self._notify_progress(viewkey)
 
     def _get_base_url(self, url: str) -> str:
         """获取URL的基础路径"""
@@ -434,80 +657,116 @@ class VideoCacheService:
     def _rewrite_uri_for_local(self, line: str, viewkey: str, segment_index: int) -> str:
         """重写标签中的URI为本地路径"""
         # 简单处理：将URI替换为本地分片路径
-        uri_match = re.search(r'URI="([^"]+)"', line)
+        uri_match = _URI_RE.search(line)
         if uri_match:
             # 对于key文件等，暂时保留原始URL
             pass
         return line
 
-    async def list_cached_videos(self) -> List[dict]:
-        """列出所有已缓存的视频"""
-        if not self._cache_dir.exists():
-            return []
-
+    def _scan_cache_sync(self) -> Tuple[List[dict], int]:
+        """一次遍历缓存目录，同时统计已缓存视频列表和总大小（同步，需在线程中调用）"""
         cached = []
+        total = 0
+
+        try:
+            entries = list(os.scandir(self._cache_dir))
+        except FileNotFoundError:
+            return [], 0
+
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # M3U8格式缓存目录
+                    size = _dir_size(entry.path)
+                    total += size
+                    if os.path.exists(os.path.join(entry.path, ".complete")):
+                        cached.append({
+                            "viewkey": entry.name,
+                            "type": "m3u8",
+                            "size": size,
+                        })
+                elif entry.is_file(follow_symlinks=False):
+                    size = entry.stat(follow_symlinks=False).st_size
+                    total += size
+                    if entry.name.endswith(".mp4"):
+                        cached.append({
+                            "viewkey": entry.name[:-4],
+                            "type": "mp4",
+                            "size": size,
+                        })
+            except FileNotFoundError:
+                # 遍历期间被删除
+                continue
 
-        # 检查M3U8格式缓存
-        for item in self._cache_dir.iterdir():
-            if item.is_dir():
-                complete_marker = item / ".complete"
-                if complete_marker.exists():
-                    # 计算目录大小
-                    size = sum(f.stat().st_size for f in item.iterdir() if f.is_file())
-                    cached.append({
-                        "viewkey": item.name,
-                        "type": "m3u8",
-                        "size": size,
-                    })
-            elif item.suffix == ".mp4":
-                cached.append({
-                    "viewkey": item.stem,
-                    "type": "mp4",
-                    "size": item.stat().st_size,
-                })
-
-        return cached
+        return cached, total
 
-    async def delete_cached_video(self, viewkey: str) -> bool:
-        """删除指定视频的缓存"""
+    async def stat_all(self) -> Tuple[List[dict], int]:
+        """获取已缓存视频列表和缓存总大小（结果缓存几秒，避免翻页时重复遍历）"""
+        now = time.monotonic()
+        if self._stat_cache and now - self._stat_cache[0] < _STAT_CACHE_TTL:
+            return self._stat_cache[1], self._stat_cache[2]
+
+        cached, total = await asyncio.to_thread(self._scan_cache_sync)
+        self._stat_cache = (now, cached, total)
+        self._cached_keys.update(v["viewkey"] for v in cached)
+        return cached, total
+
+    def _invalidate_stat_cache(self):
+        """缓存内容变化后使统计结果失效"""
+        self._stat_cache = None
+
+    def _delete_video_sync(self, viewkey: str) -> bool:
+        """删除视频的M3U8缓存目录和MP4文件（同步，需在线程中调用）"""
         deleted = False
 
         # 删除M3U8缓存目录
         cache_dir = self._get_video_cache_dir(viewkey)
         if cache_dir.exists():
-            import shutil
-            shutil.rmtree(cache_dir)
+            shutil.rmtree(cache_dir, ignore_errors=True)
             deleted = True
 
         # 删除MP4缓存
-        mp4_path = self._get_mp4_cache_path(viewkey)
-        if mp4_path.exists():
-            mp4_path.unlink()
+        try:
+            self._get_mp4_cache_path(viewkey).unlink()
             deleted = True
+        except FileNotFoundError:
+            pass
 
+        cache_index.delete_detail(viewkey)
         return deleted
 
-    async def clear_all_cache(self) -> int:
-        """清除所有缓存，返回删除的数量"""
-        if not self._cache_dir.exists():
+    async def delete_cached_video(self, viewkey: str) -> bool:
+        """删除指定视频的缓存"""
+        self._cached_keys.discard(viewkey)
+        self._detail_memcache.pop(viewkey, None)
+
+        # 分片较多时删除可能耗时数秒，放到线程中执行
+        deleted = await asyncio.to_thread(self._delete_video_sync, viewkey)
+        if deleted:
+            self._invalidate_stat_cache()
+        return deleted
+
+    def _clear_all_sync(self) -> int:
+        """清空详情和列表索引，删除整个缓存目录后重建，返回删除的数量（同步，需在线程中调用）"""
+        cache_index.clear()
+        try:
+            count = len(os.listdir(self._cache_dir))
+        except FileNotFoundError:
             return 0
 
-        import shutil
-        count = len(list(self._cache_dir.iterdir()))
-        shutil.rmtree(self._cache_dir)
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
         self._cache_dir.mkdir(parents=True, exist_ok=True)
         return count
 
-    def get_cache_size(self) -> int:
-        """获取缓存总大小（字节）"""
-        if not self._cache_dir.exists():
-            return 0
+    async def clear_all_cache(self) -> int:
+        """清除所有缓存，返回删除的数量"""
+        self._cached_keys.clear()
+        self._detail_memcache.clear()
+        self._list_memcache.clear()
 
-        total = 0
-        for item in self._cache_dir.rglob("*"):
-            if item.is_file():
-                total += item.stat().st_size
-        return total
+        count = await asyncio.to_thread(self._clear_all_sync)
+        self._invalidate_stat_cache()
+        return count
 
     async def close(self):
         """关闭会话"""
@@ -50,6 +50,24 @@ start_frontend() {
     npm run dev
 }
 
+# 启动常驻无头 Chrome（供 BROWSER_MODE=cdp 连接，后端重启时无需重新启动浏览器）
+start_chrome() {
+    echo "启动无头 Chrome (调试端口 ${CDP_PORT:-9222})..."
+    CHROME_BIN="${CHROME_BIN:-$(command -v google-chrome || command -v chromium || command -v chromium-browser)}"
+    if [ -z "$CHROME_BIN" ]; then
+        echo "错误: 未找到 Chrome/Chromium，可通过 CHROME_BIN 指定"
+        exit 1
+    fi
+    exec "$CHROME_BIN" \
+        --headless=new \
+        --remote-debugging-address=127.0.0.1 \
+        --remote-debugging-port="${CDP_PORT:-9222}" \
+        --user-data-dir="${CHROME_USER_DATA_DIR:-$HOME/.noproxy-chrome}" \
+        --no-first-run \
+        --disable-gpu \
+        --mute-audio
+}
+
 # 构建前端
 build_frontend() {
     echo "构建前端..."
@@ -71,16 +89,20 @@ case "$1" in
     frontend)
         start_frontend
         ;;
+    chrome)
+        start_chrome
+        ;;
     build)
         build_frontend
         ;;
     *)
-        echo "用法: $0 {install|backend|frontend|build}"
+        echo "用法: $0 {install|backend|frontend|chrome|build}"
         echo ""
         echo "命令说明:"
         echo "  install  - 安装所有依赖"
         echo "  backend  - 启动后端服务"
         echo "  frontend - 启动前端开发服务器"
+        echo "  chrome   - 启动常驻无头 Chrome (CDP 模式)"
         echo "  build    - 构建前端生产版本"
         exit 1
         ;;